@@ -1,42 +1,342 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, ToolMessage
-from langchain_core.chat_history import InMemoryChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain.chat_models import init_chat_model
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
+from langchain_core.chat_history import BaseChatMessageHistory
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import threading
+import time
 import uuid
 import os
-from typing import Dict
+from typing import Dict, List, Optional
 
-from schemas import QuizQuestion, QuizConfig
+from schemas import QuizQuestion, QuizConfig, QuizBatch
+from session_store import create_session_store
+from prefetch import Prefetcher
+from question_bank import QuestionBank, normalize_question
+from compaction import history_compactor
+from scheduler import FairScheduler, QueueFull, is_rate_limit_error
+from model_pool import ModelPool
+from prompt_cache import prompt_cache_stage
+from repair import correction_prompt, repair_args, repair_question
+from structured_output import asked_in_message, compact_record, output_args, parse_structured, partial_output
+from profiling import RequestProfiler
+from routing import ModelTier, create_router
+import metrics
 
 load_dotenv()
 
-app = FastAPI(title="Quiz AI Backend")
+logger = logging.getLogger("quiz.backend")
 
-# Session Store
-store: Dict[str, InMemoryChatMessageHistory] = {}
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"
 
-def get_session_history(session_id: str) -> InMemoryChatMessageHistory:
-    if session_id not in store:
-        store[session_id] = InMemoryChatMessageHistory()
-    return store[session_id]
-
-# Initialize LLM
-llm = init_chat_model(
-    os.getenv("LLM_MODEL"),
-    model_provider=os.getenv("LLM_PROVIDER"),
-    temperature=float(os.getenv("LLM_TEMPERATURE"))
+async def warm_up():
+    try:
+        for name in router.tiers:
+            models = await get_models(name)
+            if LLM_WARMUP:
+                await models.warm_up()
+    except Exception:
+        logger.exception("Model initialization failed")
+        return
+    app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the models and warm provider connections without delaying start-up
+    app.state.ready = False
+    store.start_sweeper(SESSION_SWEEP_INTERVAL)
+    task = asyncio.create_task(warm_up())
+    yield
+    task.cancel()
+    store.stop_sweeper()
+
+app = FastAPI(title="Quiz AI Backend", lifespan=lifespan)
+
+# Session Store (memory or sqlite, see SESSION_STORE), expired sessions are swept while the app runs
+store = create_session_store()
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+def get_session_history(session_id: str) -> BaseChatMessageHistory:
+    return metrics.InstrumentedHistory(store.get(session_id))
+
+# Instrumentation (see /metrics)
+metrics_handler = metrics.MetricsCallbackHandler()
+metrics.registry.register(metrics.Gauge(
+    "quiz_active_sessions", "Sessions in the session store", callback=lambda: len(store)))
+
+# On-demand profiling of single requests (see profiling.py); disabled without PROFILE_TOKEN
+profiler = RequestProfiler(
+    directory=os.getenv("PROFILE_DIR", "profiles"),
+    token=os.getenv("PROFILE_TOKEN", ""),
+    sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+    sample_interval=float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005")),
+    trace_allocations=os.getenv("PROFILE_ALLOCATIONS", "1") == "1",
+    max_profiles=int(os.getenv("PROFILE_MAX", "100"))
 )
-# Initialize LLM with tools
-llm_with_tools = llm.bind_tools([QuizQuestion])
 
-# Chain with History
-chain_with_history = RunnableWithMessageHistory(
-    llm_with_tools,
-    get_session_history
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    # Registered before record_request, so it runs inside it and sees the request id
+    if not profiler.wants(request.url.path, request.headers.get("X-Profile")):
+        return await call_next(request)
+    run = profiler.start(metrics.request_id_var.get(), request.url.path)
+    if run is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    except BaseException:
+        profiler.finish(run, {"method": request.method, "path": request.url.path, "status": 500})
+        raise
+    info = {"method": request.method, "path": request.url.path, "status": response.status_code}
+    body = response.body_iterator
+
+    async def profiled_body():
+        # Streamed responses are still running here, stop once the body is sent
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            profiler.finish(run, info)
+
+    response.body_iterator = profiled_body()
+    response.headers["X-Profile-Name"] = run.name
+    return response
+
+@app.middleware("http")
+async def record_request(request: Request, call_next):
+    request_id = metrics.new_request_id()
+    start = time.perf_counter()
+
+    def observe(status: int):
+        # Route template keeps session ids out of the labels
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        metrics.http_request_seconds.observe(
+            time.perf_counter() - start, method=request.method, path=path, status=status
+        )
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        observe(500)
+        raise
+    response.headers["X-Request-ID"] = request_id
+    body = response.body_iterator
+
+    async def observed_body():
+        # Streamed responses are still running here, the request ends once the body is sent
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            observe(response.status_code)
+
+    response.body_iterator = observed_body()
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return metrics.registry.render()
+
+class ProfilingSettings(BaseModel):
+    sample_rate: float = Field(ge=0, le=1)
+
+def check_admin(request: Request):
+    if not profiler.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not profiler.check_token(request.headers.get("X-Admin-Token")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.get("/admin/profiling")
+async def get_profiling(request: Request):
+    check_admin(request)
+    return {**profiler.settings(), "profiles": profiler.profiles()}
+
+@app.put("/admin/profiling")
+async def set_profiling(settings: ProfilingSettings, request: Request):
+    check_admin(request)
+    profiler.sample_rate = settings.sample_rate
+    return profiler.settings()
+
+@app.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz(response: Response):
+    # Ready once the models are built and provider connections are warm
+    if not getattr(app.state, "ready", False):
+        response.status_code = 503
+        return {"status": "starting"}
+    return {"status": "ready"}
+
+# Shared bank of validated questions per (topic, difficulty)
+question_bank = QuestionBank(
+    max_topics=int(os.getenv("QUESTION_BANK_MAX_TOPICS", "200")),
+    max_per_topic=int(os.getenv("QUESTION_BANK_MAX_PER_TOPIC", "200")),
+    similarity_threshold=float(os.getenv("QUESTION_BANK_SIMILARITY", "0.8"))
+) if os.getenv("QUESTION_BANK", "1") == "1" else None
+
+# Admission control for model calls (per process): concurrency, rate limits, fair queuing
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_EST_TOKENS = int(os.getenv("LLM_EST_TOKENS", "1500"))
+scheduler = FairScheduler(
+    max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "100")),
+    requests_per_minute=float(os.getenv("LLM_RPM", "0")),
+    tokens_per_minute=float(os.getenv("LLM_TPM", "0")),
+    retries=int(os.getenv("LLM_RETRIES", "3")),
+    backoff=float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
 )
+throttled_total = metrics.registry.register(metrics.Counter(
+    "quiz_llm_throttled_total", "Provider rate-limit errors retried by the scheduler"))
+shed_total = metrics.registry.register(metrics.Counter(
+    "quiz_llm_shed_total", "Model calls rejected with 429 because the queue was full"))
+rate_limited_total = metrics.registry.register(metrics.Counter(
+    "quiz_llm_rate_limited_total", "Model calls rejected with 429 because the provider was still throttling after retries"))
+metrics.registry.register(metrics.Gauge(
+    "quiz_llm_queue_waiting", "Model calls waiting for a slot", callback=lambda: scheduler.waiting))
+metrics.registry.register(metrics.Gauge(
+    "quiz_llm_active", "Model calls in flight", callback=lambda: scheduler.active))
+
+def overloaded(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, try again later",
+        headers={"Retry-After": str(max(1, round(retry_after)))}
+    )
+
+def create_llm(model: str, provider: str, temperature: float, max_tokens: Optional[int] = None):
+    if provider == "fake":
+        # Local deterministic model for development and benchmarks
+        from fake_llm import FakeQuizChatModel
+        return FakeQuizChatModel(
+            latency=float(os.getenv("FAKE_LLM_LATENCY", "0.5")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "200"))
+        )
+    # Imported here: the provider packages are the slowest part of the start-up
+    from langchain.chat_models import init_chat_model
+    limits = {"max_tokens": max_tokens} if max_tokens else {}
+    if scheduler.retries > 0:
+        # The scheduler retries throttling itself, SDK retries would multiply the attempts and bypass its limits
+        limits["max_retries"] = 0
+    return init_chat_model(model, model_provider=provider, temperature=temperature, **limits)
+
+# Prompt caching of the system prompt, tool schema and previous turns (PROMPT_CACHE=0 disables)
+PROMPT_CACHE_PROVIDERS = {"anthropic"}
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") == "1"
+
+def cache_stage(name: str):
+    return prompt_cache_stage() if PROMPT_CACHE and name.split(":", 1)[0] in PROMPT_CACHE_PROVIDERS else None
+
+REPAIR_REGENERATE = os.getenv("REPAIR_REGENERATE", "1") == "1"
+# Tool calling or provider-native JSON output: auto, tool or json (see structured_output.py)
+OUTPUT_STRATEGY = os.getenv("LLM_OUTPUT_STRATEGY", "auto")
+
+# Model tier of each session by difficulty and topic (LLM_ROUTING_FILE, see routing.py)
+router = create_router()
+
+class QuizModels:
+    """Model clients and chains of one tier. Built on first use, or by the warm-up when the app starts."""
+
+    def __init__(self, tier: ModelTier):
+        # Ordered model pool: the tier model, then its fallbacks ("provider:model")
+        models = []
+        for spec in tier.models:
+            provider, model = spec.split(":", 1)
+            models.append((spec, create_llm(model, provider, tier.temperature, tier.max_tokens)))
+        self.pool = ModelPool(
+            models,
+            failures=int(os.getenv("CIRCUIT_FAILURES", "5")),
+            reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+            percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+            min_delay=float(os.getenv("HEDGE_MIN_DELAY", "1.0")),
+            max_delay=float(os.getenv("HEDGE_MAX_DELAY", "20")),
+            initial_delay=float(os.getenv("HEDGE_INITIAL_DELAY", "5"))
+        )
+
+        # Structured output per model, tool calling or native JSON (hedged across the pool when fallbacks are configured)
+        llm_question = self.pool.bind_structured(QuizQuestion, OUTPUT_STRATEGY, callbacks=[metrics_handler],
+                                                 prepare=cache_stage)
+        llm_batch = self.pool.bind_structured(QuizBatch, OUTPUT_STRATEGY, callbacks=[metrics_handler],
+                                              prepare=cache_stage)
+        # Used without history to re-ask for a question the repair stage could not recover
+        self.forced = llm_question
+
+        # Compact old turns of the history before each request (HISTORY_COMPACTION=0 disables)
+        if os.getenv("HISTORY_COMPACTION", "1") == "1":
+            compactor = history_compactor(
+                keep_turns=int(os.getenv("HISTORY_KEEP_TURNS", "2")),
+                max_tokens=int(os.getenv("HISTORY_MAX_TOKENS", "3000"))
+            )
+            llm_question = compactor | llm_question
+            llm_batch = compactor | llm_batch
+
+        # The history is loaded and updated by the callers, see invoke_chain and record_questions
+        self.chain = llm_question
+        self.batch_chain = llm_batch
+
+    async def warm_up(self):
+        """Open a connection to each provider so the first request skips client setup and the TLS handshake."""
+        for entry in self.pool.entries:
+            client = getattr(entry.llm, "_async_client", None)
+            if client is None or not hasattr(client, "models"):
+                continue
+            try:
+                # Listing models is free and goes through the same connection pool as completions
+                await asyncio.wait_for(client.models.list(limit=1), timeout=10)
+            except Exception as e:
+                logger.warning("Warm-up of %s failed: %s", entry.name, e)
+
+_models: Dict[str, QuizModels] = {}
+_models_lock = threading.Lock()
+
+def build_models(tier: ModelTier) -> QuizModels:
+    with _models_lock:
+        if tier.name not in _models:
+            _models[tier.name] = QuizModels(tier)
+    return _models[tier.name]
+
+async def get_models(name: Optional[str] = None) -> QuizModels:
+    tier = router.tier(name)
+    models = _models.get(tier.name)
+    if models is not None:
+        return models
+    # Importing and configuring provider clients blocks, keep it off the event loop
+    return await asyncio.to_thread(build_models, tier)
+
+def session_tier(session_id: str) -> ModelTier:
+    meta = store.get_meta(session_id)
+    return router.tier(meta.get("tier") if meta else None)
+
+def session_usage(session_id: str) -> Dict[str, int]:
+    """Tokens used by the session so far, kept in the session meta so that all workers see them."""
+    meta = store.get_meta(session_id) or {}
+    return {"input": 0, "output": 0, **meta.get("usage", {})}
+
+def record_usage(session_id: str, msg):
+    """Add the tokens reported for a model reply to the session usage."""
+    usage = getattr(msg, "usage_metadata", None)
+    meta = store.get_meta(session_id)
+    if not usage or meta is None:
+        return
+    totals = session_usage(session_id)
+    for kind in ("input", "output"):
+        totals[kind] += usage.get(f"{kind}_tokens", 0)
+    store.set_meta(session_id, {**meta, "usage": totals})
+
+def check_budget(session_id: str, tier: ModelTier):
+    """Refuse a model call once the session used up its token budget; the last call may overshoot it."""
+    exhausted = tier.exhausted(session_usage(session_id))
+    if exhausted:
+        metrics.budget_exceeded_total.inc(tier=tier.name, type=exhausted)
+        raise HTTPException(status_code=429, detail=f"Session {exhausted} token budget exceeded")
+
 
 @app.post("/start")
 async def start_quiz(config: QuizConfig):
@@ -44,7 +344,7 @@ async def start_quiz(config: QuizConfig):
     
     # Initialize history
     history = get_session_history(session_id)
-    history.clear() # Ensure clean start
+    await history.aclear() # Ensure clean start
     
     difficulty_prompt = {
         "Łatwy": "Pytania powinny być proste, oparte na powszechnie znanych faktach.",
@@ -60,44 +360,356 @@ async def start_quiz(config: QuizConfig):
     )
     
     # Add system message to history
-    history.add_message(SystemMessage(content=system_msg))
+    await history.aadd_messages([SystemMessage(content=system_msg)])
+    tier = router.route(config.topic, config.difficulty)
+    store.set_meta(session_id, {**config.model_dump(), "tier": tier.name})
+    metrics.tier_sessions_total.inc(tier=tier.name)
+
+    # Start generating the first question in the background
+    prefetcher.open(session_id, limit=config.num_questions)
     
-    return {"session_id": session_id, "message": "Quiz initialized"}
+    return {"session_id": session_id, "message": "Quiz initialized", "tier": tier.name}
+
+async def session_messages(session_id: str, prompt: str) -> list:
+    return await get_session_history(session_id).aget_messages() + [HumanMessage(content=prompt)]
+
+async def invoke_chain(session_id: str, chain=None, prompt: str = "Generuj kolejne pytanie.", messages=None):
+    tier = session_tier(session_id)
+    check_budget(session_id, tier)
+    chain = chain or (await get_models(tier.name)).chain
+    messages = messages or await session_messages(session_id, prompt)
+    # Wait for a fair share of the model capacity; the event loop stays free while waiting
+    try:
+        with metrics.span("queue_wait"):
+            await scheduler.acquire(session_id, tokens=LLM_EST_TOKENS)
+    except QueueFull as e:
+        shed_total.inc()
+        raise overloaded(e.retry_after)
+    start = time.monotonic()
+    try:
+        with metrics.span("chain", session_id=session_id):
+            msg = await scheduler.call_with_retries(
+                lambda: asyncio.wait_for(
+                    chain.ainvoke(messages, config={"metadata": {"session_id": session_id, "tier": tier.name}}),
+                    timeout=LLM_TIMEOUT
+                ),
+                tokens=LLM_EST_TOKENS,
+                on_throttle=throttled_total.inc
+            )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Model request timed out")
+    except Exception as e:
+        if is_rate_limit_error(e):
+            rate_limited_total.inc()
+            raise overloaded(scheduler.retry_after())
+        raise
+    finally:
+        scheduler.release(time.monotonic() - start)
+
+    usage = getattr(msg, "usage_metadata", None) or {}
+    scheduler.record_usage(usage.get("total_tokens", LLM_EST_TOKENS), LLM_EST_TOKENS)
+    record_usage(session_id, msg)
+    return msg
+
+async def record_questions(session_id: str, questions: List[QuizQuestion]):
+    """Add served questions to the history in compact form, so the model does not repeat them."""
+    if not questions:
+        return
+    prompt = "Generuj kolejne pytanie." if len(questions) == 1 else f"Generuj {len(questions)} kolejnych pytań."
+    await get_session_history(session_id).aadd_messages([HumanMessage(content=prompt), compact_record(questions)])
+
+async def asked_questions(session_id: str) -> set:
+    """Normalized texts of questions already generated in this session."""
+    asked = set()
+    for message in await get_session_history(session_id).aget_messages():
+        asked.update(normalize_question(question) for question in asked_in_message(message))
+    return asked
 
 class QuestionRequest(BaseModel):
     session_id: str
 
+class BatchRequest(BaseModel):
+    session_id: str
+    num_questions: int = Field(default=3, ge=1, le=10)
+
+async def regenerate_question(session_id: str, msg: AIMessage) -> Optional[QuizQuestion]:
+    """Re-ask the model with a short correction prompt, without the session history."""
+    messages = [m for m in (await get_session_history(session_id).aget_messages())[:1] if isinstance(m, SystemMessage)]
+    messages.append(HumanMessage(content=correction_prompt(msg)))
+    retry = await invoke_chain(session_id, chain=(await get_models(session_tier(session_id).name)).forced,
+                               messages=messages)
+    return parse_structured(retry, QuizQuestion) or repair_question(retry)
+
+async def resolve_question(session_id: str, msg: AIMessage, record: bool = True) -> QuizQuestion:
+    """Validated question from a model reply: as is, repaired locally or, as a last resort, re-asked.
+
+    With `record=False` the caller adds the question to the history itself.
+    """
+    question, result = parse_structured(msg, QuizQuestion), "ok"
+    if question is None:
+        question, result = repair_question(msg), "repaired"
+    if question is None and REPAIR_REGENERATE:
+        question, result = await regenerate_question(session_id, msg), "regenerated"
+    if question is None:
+        metrics.structured_output_total.inc(result="failed")
+        raise HTTPException(status_code=500, detail="Model failed to generate structured output")
+    if record:
+        await record_questions(session_id, [question])
+    metrics.structured_output_total.inc(result=result)
+    return question
+
+async def generate_question(session_id: str, record: bool = True) -> QuizQuestion:
+    # Invoke chain - returns AIMessage
+    msg = await invoke_chain(session_id)
+    return await resolve_question(session_id, msg, record=record)
+
+def bank_add(session_id: str, questions: List[QuizQuestion]):
+    meta = store.get_meta(session_id)
+    if question_bank is None or meta is None:
+        return
+    for question in questions:
+        question_bank.add(meta["topic"], meta["difficulty"], question)
+
+async def bank_take(session_id: str, count: int) -> List[QuizQuestion]:
+    """Questions from the bank not yet asked in this session, recorded in its history."""
+    meta = store.get_meta(session_id)
+    if question_bank is None or meta is None:
+        return []
+    asked = await asked_questions(session_id)
+    questions = question_bank.sample_many(meta["topic"], meta["difficulty"], count, exclude=asked)
+    await record_questions(session_id, questions)
+    return questions
+
+async def next_question(session_id: str) -> QuizQuestion:
+    # Serve from the bank, call the model only to top it up
+    for question in await bank_take(session_id, 1):
+        return question
+    question = await generate_question(session_id)
+    bank_add(session_id, [question])
+    return question
+
+# Questions generated ahead of the user (PREFETCH_DEPTH=0 disables)
+prefetcher = Prefetcher(
+    next_question,
+    depth=int(os.getenv("PREFETCH_DEPTH", "1")),
+    max_sessions=int(os.getenv("SESSION_MAX", "1000"))
+)
+PREFETCH_CANCEL_ON_CLEANUP = os.getenv("PREFETCH_CANCEL_ON_CLEANUP", "1") == "1"
+
 @app.post("/quiz", response_model=QuizQuestion)
 async def get_question(req: QuestionRequest):
     if req.session_id not in store:
         raise HTTPException(status_code=404, detail="Session not found")
-    
-    # Invoke chain - returns AIMessage
-    msg = chain_with_history.invoke(
-        [HumanMessage(content="Generuj kolejne pytanie.")],
-        config={"configurable": {"session_id": req.session_id}}
+    return await prefetcher.get(req.session_id)
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream_chain(session_id: str):
+    """Yield the accumulated AIMessageChunk after every streamed chunk."""
+    loop = asyncio.get_running_loop()
+    tier = session_tier(session_id)
+    check_budget(session_id, tier)
+    try:
+        with metrics.span("queue_wait"):
+            await scheduler.acquire(session_id, tokens=LLM_EST_TOKENS)
+    except QueueFull as e:
+        shed_total.inc()
+        raise overloaded(e.retry_after)
+    start = time.monotonic()
+    try:
+        chain = (await get_models(tier.name)).chain
+        messages = await session_messages(session_id, "Generuj kolejne pytanie.")
+
+        async def open_stream():
+            # Provider throttling surfaces before the first chunk, so that part can be retried
+            deadline = loop.time() + LLM_TIMEOUT
+            stream = chain.astream(messages, config={"metadata": {"session_id": session_id, "tier": tier.name}})
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout=LLM_TIMEOUT)
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await stream.aclose()
+                raise
+            return stream, first, deadline
+
+        # Spans the whole stream, until the last chunk
+        with metrics.span("chain", session_id=session_id):
+            stream = full = None
+            try:
+                stream, chunk, deadline = await scheduler.call_with_retries(
+                    open_stream, tokens=LLM_EST_TOKENS, on_throttle=throttled_total.inc
+                )
+                while chunk is not None:
+                    full = chunk if full is None else full + chunk
+                    yield full
+                    try:
+                        chunk = await asyncio.wait_for(stream.__anext__(), timeout=max(deadline - loop.time(), 0))
+                    except StopAsyncIteration:
+                        chunk = None
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=504, detail="Model request timed out")
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    rate_limited_total.inc()
+                    raise overloaded(scheduler.retry_after())
+                raise
+            finally:
+                if stream is not None:
+                    await stream.aclose()
+                # Also when the client went away, the tokens are used all the same
+                if full is not None:
+                    record_usage(session_id, full)
+    finally:
+        scheduler.release(time.monotonic() - start)
+
+async def stream_question(session_id: str):
+    """Yield partial question fields as they arrive, then the validated QuizQuestion."""
+    full = None
+    last_partial = None
+    async for full in stream_chain(session_id):
+        partial = partial_output(full)
+        if partial is None:
+            continue
+        # The answer is only revealed with the validated question
+        partial = {k: v for k, v in partial.items() if k != "correct_answer"}
+        if partial and partial != last_partial:
+            last_partial = partial
+            yield partial
+
+    if full is None:
+        metrics.structured_output_total.inc(result="failed")
+        raise HTTPException(status_code=500, detail="Model failed to generate structured output")
+    yield await resolve_question(session_id, full)
+
+async def question_events(session_id: str):
+    question = prefetcher.ready(session_id)
+    if question is None:
+        async with prefetcher.lock(session_id):
+            question = prefetcher.ready(session_id)
+            if question is None:
+                question = next(iter(await bank_take(session_id, 1)), None)
+            if question is None:
+                prefetcher.reserve(session_id)
+                try:
+                    async for item in stream_question(session_id):
+                        if isinstance(item, QuizQuestion):
+                            question = item
+                            bank_add(session_id, [question])
+                        else:
+                            yield sse("partial", item)
+                except HTTPException as e:
+                    yield sse("error", {"status_code": e.status_code, "detail": e.detail})
+                    return
+                except ValidationError:
+                    yield sse("error", {"status_code": 500, "detail": "Model failed to generate structured output"})
+                    return
+                except Exception:
+                    # The response has already started, report the failure as an event instead of cutting it off
+                    logger.exception("Streaming a question failed")
+                    metrics.structured_output_total.inc(result="failed")
+                    yield sse("error", {"status_code": 500, "detail": "Model request failed"})
+                    return
+                finally:
+                    if question is None:
+                        prefetcher.release(session_id)
+
+    prefetcher.refill(session_id)
+    yield sse("question", question.model_dump())
+
+@app.post("/quiz/stream")
+async def stream_next_question(req: QuestionRequest):
+    if req.session_id not in store:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return StreamingResponse(
+        question_events(req.session_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    # Handle history and parsing
-    if msg.tool_calls:
-        tool_call = msg.tool_calls[0]
-        
-        # Add ToolMessage to satisfy API requirements (especially Anthropic)
-        tool_msg = ToolMessage(
-            tool_call_id=tool_call["id"],
-            content="Parsed successfully"
-        )
-        get_session_history(req.session_id).add_message(tool_msg)
-        
-        # Return clean QuizQuestion instance
-        return QuizQuestion(**tool_call["args"])
-    
-    raise HTTPException(status_code=500, detail="Model failed to generate structured output")
+@app.post("/quiz/batch", response_model=List[QuizQuestion])
+async def get_question_batch(req: BatchRequest):
+    if req.session_id not in store:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    # Keep background prefetch from writing to the history meanwhile
+    async with prefetcher.lock(req.session_id):
+        return await generate_batch(req.session_id, req.num_questions)
+
+# Per-question model calls allowed for each question the batch call did not deliver
+BATCH_FALLBACK_ATTEMPTS = 3
+
+async def generate_batch(session_id: str, num_questions: int) -> List[QuizQuestion]:
+    # Prefetched questions are already in the history, serve them first
+    questions: List[QuizQuestion] = []
+    while len(questions) < num_questions:
+        question = prefetcher.ready(session_id)
+        if question is None:
+            break
+        questions.append(question)
+    if len(questions) < num_questions:
+        questions += await bank_take(session_id, num_questions - len(questions))
+    if len(questions) == num_questions:
+        return questions
+    seen = await asked_questions(session_id)
+    generated: List[QuizQuestion] = []
+
+    def accept(question: QuizQuestion) -> bool:
+        key = normalize_question(question.question)
+        if not key or key in seen:
+            return False
+        seen.add(key)
+        generated.append(question)
+        return True
+
+    # One model call for the rest of the quiz
+    missing = num_questions - len(questions)
+    msg = await invoke_chain(
+        session_id,
+        chain=(await get_models(session_tier(session_id).name)).batch_chain,
+        prompt=f"Generuj {missing} kolejnych pytań."
+    )
+    args = output_args(msg)
+    if args is not None:
+        metrics.structured_output_total.inc(result="ok")
+        # Validate each item separately so one bad question does not drop the batch
+        for item in args.get("questions", [])[:missing]:
+            try:
+                accept(QuizQuestion.model_validate(item))
+            except ValidationError:
+                question = repair_args(item)
+                if question is not None:
+                    metrics.structured_output_total.inc(result="repaired")
+                    accept(question)
+    await record_questions(session_id, generated)
+
+    # Fall back to the per-question path for missing items, only accepted questions go to the history
+    for _ in range(BATCH_FALLBACK_ATTEMPTS * (missing - len(generated))):
+        if len(generated) == missing:
+            break
+        question = await generate_question(session_id, record=False)
+        if accept(question):
+            await record_questions(session_id, [question])
+
+    bank_add(session_id, generated)
+    return questions + generated
+
+@app.get("/usage/{session_id}")
+async def get_usage(session_id: str):
+    if session_id not in store:
+        raise HTTPException(status_code=404, detail="Session not found")
+    tier = session_tier(session_id)
+    return {"tier": tier.name, "model": tier.model, "usage": session_usage(session_id),
+            "budget": tier.budget()}
 
 @app.delete("/cleanup/{session_id}")
 async def cleanup_session(session_id: str):
+    await prefetcher.close(session_id, cancel=PREFETCH_CANCEL_ON_CLEANUP)
     if session_id in store:
-        del store[session_id]
+        for kind, count in session_usage(session_id).items():
+            metrics.session_tokens.observe(count, type=kind)
+    if store.delete(session_id):
         return {"message": "Session cleared"}
     return {"message": "Session not found or already cleared"}
 
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import random
+from typing import AsyncIterator, Iterator, List, Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from schemas import QuizConfig, QuizQuestion
+
+# Gateway errors mean the request did not reach the backend, so they are safe to retry even for POST
+# (/start is not idempotent). 504 is the backend's own model timeout and is not retried.
+RETRY_STATUSES = (502, 503)
+
+
+class SSEParser:
+    """Incremental parser for the lines of a server-sent events stream."""
+
+    def __init__(self):
+        self.event, self.data = "message", []
+
+    def feed(self, line: str) -> Optional[Tuple[str, dict]]:
+        """Consume one line, return (event, data) when an event is complete."""
+        if not line:
+            item = (self.event, json.loads("\n".join(self.data))) if self.data else None
+            self.event, self.data = "message", []
+            return item
+        if line.startswith("event:"):
+            self.event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            self.data.append(line[len("data:"):].strip())
+        return None
+
+
+def iter_sse(lines: Iterator[str]) -> Iterator[Tuple[str, dict]]:
+    parser = SSEParser()
+    for line in lines:
+        item = parser.feed(line)
+        if item:
+            yield item
+
+
+class BackendClient:
+    """Quiz backend client with keep-alive connection pooling, timeouts and retries."""
+
+    def __init__(self, base_url: str, timeout: Tuple[float, float] = (3.05, 90), retries: int = 3,
+                 backoff: float = 0.5, pool_size: int = 10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # a slow model is not retried, it would only multiply the wait
+            other=0,  # the request may already have been processed
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=None,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _url(self, path: str) -> str:
+        return f"{self.base_url}{path}"
+
+    def start(self, config: QuizConfig) -> str:
+        response = self.session.post(self._url("/start"), json=config.model_dump(), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["session_id"]
+
+    def next_question(self, session_id: str) -> QuizQuestion:
+        response = self.session.post(self._url("/quiz"), json={"session_id": session_id}, timeout=self.timeout)
+        response.raise_for_status()
+        return QuizQuestion(**response.json())
+
+    def batch(self, session_id: str, num_questions: int) -> List[QuizQuestion]:
+        response = self.session.post(
+            self._url("/quiz/batch"),
+            json={"session_id": session_id, "num_questions": num_questions},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return [QuizQuestion(**item) for item in response.json()]
+
+    def stream_question(self, session_id: str) -> Iterator[Tuple[str, dict]]:
+        with self.session.post(
+            self._url("/quiz/stream"), json={"session_id": session_id}, stream=True, timeout=self.timeout
+        ) as response:
+            response.raise_for_status()
+            yield from iter_sse(response.iter_lines(decode_unicode=True))
+
+    def cleanup(self, session_id: str):
+        self.session.delete(self._url(f"/cleanup/{session_id}"), timeout=self.timeout)
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncBackendClient:
+    """Asynchronous variant of `BackendClient` built on httpx."""
+
+    def __init__(self, base_url: str, timeout: Tuple[float, float] = (3.05, 90), retries: int = 3,
+                 backoff: float = 0.5, pool_size: int = 10):
+        self.retries = retries
+        self.backoff = backoff
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=retries)  # connection errors
+        )
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        for attempt in range(self.retries + 1):
+            response = await self.client.request(method, path, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return response
+            # Exponential backoff with jitter
+            await asyncio.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    async def start(self, config: QuizConfig) -> str:
+        response = await self._request("POST", "/start", json=config.model_dump())
+        response.raise_for_status()
+        return response.json()["session_id"]
+
+    async def next_question(self, session_id: str) -> QuizQuestion:
+        response = await self._request("POST", "/quiz", json={"session_id": session_id})
+        response.raise_for_status()
+        return QuizQuestion(**response.json())
+
+    async def batch(self, session_id: str, num_questions: int) -> List[QuizQuestion]:
+        response = await self._request(
+            "POST", "/quiz/batch", json={"session_id": session_id, "num_questions": num_questions}
+        )
+        response.raise_for_status()
+        return [QuizQuestion(**item) for item in response.json()]
+
+    async def stream_question(self, session_id: str) -> AsyncIterator[Tuple[str, dict]]:
+        async with self.client.stream("POST", "/quiz/stream", json={"session_id": session_id}) as response:
+            response.raise_for_status()
+            parser = SSEParser()
+            async for line in response.aiter_lines():
+                item = parser.feed(line)
+                if item:
+                    yield item
+
+    async def cleanup(self, session_id: str):
+        await self._request("DELETE", f"/cleanup/{session_id}")
+
+    async def aclose(self):
+        await self.client.aclose()
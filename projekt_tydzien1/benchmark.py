@@ -0,0 +1,120 @@
+"""Load test of the quiz backend with a fake LLM.
+
+Runs /start -> N x /quiz -> /cleanup flows through the ASGI app in-process
+and reports latency percentiles, throughput and session store memory.
+
+    python benchmark.py --sessions 200 --concurrency 50 --questions 5 --latency 0.5
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Quiz backend load test with a fake LLM")
+    parser.add_argument("--sessions", type=int, default=100, help="number of quiz sessions")
+    parser.add_argument("--concurrency", type=int, default=20, help="sessions running at the same time")
+    parser.add_argument("--questions", type=int, default=5, help="questions per session")
+    parser.add_argument("--endpoint", choices=["quiz", "stream", "batch"], default="quiz")
+    parser.add_argument("--topics", type=int, default=0, help="distinct topics, 0 = unique topic per session")
+    parser.add_argument("--think", type=float, default=0.0, help="seconds a user spends on each question")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake LLM time to first token")
+    parser.add_argument("--tps", type=float, default=200.0, help="fake LLM output tokens per second")
+    return parser.parse_args()
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(int(round(p / 100 * (len(values) - 1))), len(values) - 1)
+    return values[index]
+
+
+async def run_session(client, args, index: int, timings: Dict[str, List[float]], errors: Dict[str, int]):
+    async def call(name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        timings[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors[f"{name} {response.status_code}"] += 1
+            return None
+        return response
+
+    topic = f"Temat {index % args.topics if args.topics else index}"
+    response = await call("start", "POST", "/start", json={"topic": topic, "num_questions": args.questions})
+    if response is None:
+        return
+    session_id = response.json()["session_id"]
+
+    if args.endpoint == "batch":
+        await call("batch", "POST", "/quiz/batch", json={"session_id": session_id, "num_questions": args.questions})
+    else:
+        url = "/quiz/stream" if args.endpoint == "stream" else "/quiz"
+        for _ in range(args.questions):
+            if await call(args.endpoint, "POST", url, json={"session_id": session_id}) is None:
+                break
+            await asyncio.sleep(args.think)
+
+    await call("cleanup", "DELETE", f"/cleanup/{session_id}")
+
+
+async def main():
+    args = parse_args()
+    os.environ.update({
+        "LLM_PROVIDER": "fake",
+        "LLM_MODEL": "fake",
+        "LLM_TEMPERATURE": os.getenv("LLM_TEMPERATURE", "0"),
+        "FAKE_LLM_LATENCY": str(args.latency),
+        "FAKE_LLM_TOKENS_PER_SECOND": str(args.tps)
+    })
+    import httpx
+    import backend
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    timings: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    peak_sessions = 0
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def limited(client, index):
+        nonlocal peak_sessions
+        async with semaphore:
+            await run_session(client, args, index, timings, errors)
+            peak_sessions = max(peak_sessions, len(backend.store))
+
+    transport = httpx.ASGITransport(app=backend.app)
+    # ASGITransport does not run the lifespan, the app would otherwise build the model on the first request
+    async with backend.app.router.lifespan_context(backend.app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(client, i) for i in range(args.sessions)))
+        elapsed = time.perf_counter() - started
+
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    requests_total = sum(len(values) for values in timings.values())
+    print(f"sessions={args.sessions} concurrency={args.concurrency} questions={args.questions} "
+          f"endpoint={args.endpoint} latency={args.latency}s tps={args.tps}")
+    print(f"{'endpoint':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, values in timings.items():
+        print(f"{name:<10}{len(values):>8}" + "".join(
+            f"{percentile(values, p) * 1000:>10.1f}" for p in (50, 95, 99, 100)
+        ))
+    print(f"elapsed: {elapsed:.2f}s, throughput: {requests_total / elapsed:.1f} req/s, "
+          f"{args.sessions / elapsed:.1f} sessions/s")
+    print(f"sessions in store: peak {peak_sessions}, after cleanup {len(backend.store)}")
+    print(f"memory: +{(memory_after - memory_before) / 1024:.1f} KiB retained, "
+          f"peak {(memory_peak - memory_before) / 1024:.1f} KiB")
+    if errors:
+        print("errors: " + ", ".join(f"{name}: {count}" for name, count in errors.items()))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
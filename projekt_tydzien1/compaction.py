@@ -0,0 +1,85 @@
+from typing import List, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.runnables import RunnableLambda
+
+from structured_output import asked_in_message
+
+DIGEST_HEADER = "Pytania już zadane w tym quizie (nie powtarzaj ich):"
+
+
+def question_stems(message: BaseMessage, max_chars: int = 120) -> List[str]:
+    """Question texts recorded in an AIMessage of the history."""
+    return [question[:max_chars] for question in asked_in_message(message)]
+
+
+def split_turns(messages: Sequence[BaseMessage]):
+    """Split history into leading system messages and turns starting with a HumanMessage."""
+    system = []
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, SystemMessage) and not turns:
+            system.append(message)
+        elif isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return system, turns
+
+
+def with_digest(current: List[BaseMessage], stems: List[str]) -> List[BaseMessage]:
+    """Put the digest in front of the current request.
+
+    The digest changes with every compaction, so it goes after the prompt
+    cache breakpoints (see prompt_cache.py) instead of into the system prompt.
+    """
+    if not stems:
+        return list(current)
+    digest = {"type": "text", "text": DIGEST_HEADER + "\n" + "\n".join(f"- {stem}" for stem in stems)}
+    if not current or not isinstance(current[0], HumanMessage):
+        return [HumanMessage(content=[digest])] + list(current)
+    first = current[0]
+    blocks = first.content if isinstance(first.content, list) else [{"type": "text", "text": first.content}]
+    return [first.model_copy(update={"content": [digest] + list(blocks)})] + list(current[1:])
+
+
+def compact_history(messages: Sequence[BaseMessage], keep_turns: int = 2, max_tokens: int = 3000) -> List[BaseMessage]:
+    """Keep the system prompt and recent turns, replace older turns with a digest of their questions.
+
+    Old turns are moved into the digest `keep_turns` at a time, so between
+    two such steps the request prefix (system prompt and kept turns) only
+    grows at the end and stays cacheable. The stored history is not
+    modified, compaction only applies to the request.
+    """
+    system, turns = split_turns(messages)
+    # The last turn is the current request
+    current, previous = turns[-1:], turns[:-1]
+    step = max(keep_turns, 1)
+    split = max(len(previous) - keep_turns, 0) // step * step
+    old, recent = previous[:split], previous[split:]
+
+    stems = [stem for turn in old for message in turn if isinstance(message, AIMessage) for stem in question_stems(message)]
+
+    def build():
+        return list(system) + [m for turn in recent for m in turn] + with_digest([m for turn in current for m in turn], stems)
+
+    compacted = build()
+    # Move more turns into the digest until the request fits the budget
+    while recent and count_tokens_approximately(compacted) > max_tokens:
+        turn = recent.pop(0)
+        stems.extend(stem for message in turn if isinstance(message, AIMessage) for stem in question_stems(message))
+        compacted = build()
+    # Last resort: forget the oldest stems
+    while stems and count_tokens_approximately(compacted) > max_tokens:
+        stems.pop(0)
+        compacted = build()
+    return compacted
+
+
+def history_compactor(keep_turns: int = 2, max_tokens: int = 3000) -> RunnableLambda:
+    """Runnable stage to put in front of the model in `RunnableWithMessageHistory`."""
+    return RunnableLambda(
+        lambda messages: compact_history(messages, keep_turns=keep_turns, max_tokens=max_tokens),
+        name="compact_history"
+    )
@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import json
+import re
+import time
+import uuid
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from structured_output import message_text
+
+_counter = itertools.count(1)
+
+
+class FakeQuizChatModel(BaseChatModel):
+    """Deterministic local model answering QuizQuestion/QuizBatch as tool calls or JSON text.
+
+    Used with LLM_PROVIDER=fake for development and benchmarks: `latency` is
+    the time to the first token, then output tokens arrive at `tokens_per_second`.
+    A `response_format` JSON schema (native structured output) gets the answer
+    as JSON text, bound tools get a tool call.
+    """
+
+    latency: float = 0.5
+    tokens_per_second: float = 200.0
+    chunk_chars: int = 16
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-quiz"
+
+    def _resolve_model_profile(self):
+        return {"tool_calling": True, "structured_output": True}
+
+    def bind_tools(self, tools, *, tool_choice: Optional[str] = None, **kwargs: Any):
+        names = [convert_to_openai_tool(tool)["function"]["name"] for tool in tools]
+        return self.bind(tool_names=names, **kwargs)
+
+    def _tool_call(self, messages: List[BaseMessage], tool_names: Optional[List[str]]) -> dict:
+        name = (tool_names or ["QuizQuestion"])[0]
+        if name == "QuizBatch":
+            prompt = next((m for m in reversed(messages) if isinstance(m, HumanMessage)), None)
+            # The prompt may follow other blocks, such as the digest of compacted history
+            match = re.search(r"Generuj (\d+)", message_text(prompt) if prompt else "")
+            args = {"questions": [self._question() for _ in range(int(match.group(1)) if match else 3)]}
+        else:
+            args = self._question()
+        return {"name": name, "args": args, "id": f"fake_{uuid.uuid4().hex[:12]}"}
+
+    @staticmethod
+    def _question() -> dict:
+        n = next(_counter)
+        return {
+            "question": f"Pytanie testowe numer {n}?",
+            "a": f"Odpowiedź A{n}",
+            "b": f"Odpowiedź B{n}",
+            "c": f"Odpowiedź C{n}",
+            "d": f"Odpowiedź D{n}",
+            "correct_answer": "abcd"[n % 4]
+        }
+
+    def _message(self, messages: List[BaseMessage], tool_names: Optional[List[str]],
+                 response_format: Optional[dict] = None) -> AIMessage:
+        if response_format:
+            tool_names = [response_format["json_schema"]["name"]]
+        tool_call = self._tool_call(messages, tool_names)
+        output_tokens = len(json.dumps(tool_call["args"])) // 4
+        input_tokens = count_tokens_approximately(messages)
+        return AIMessage(
+            content=json.dumps(tool_call["args"], ensure_ascii=False) if response_format else "",
+            tool_calls=[] if response_format else [tool_call],
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens
+            }
+        )
+
+    def _duration(self, message: AIMessage) -> float:
+        return self.latency + message.usage_metadata["output_tokens"] / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, tool_names=None, response_format=None, **kwargs) -> ChatResult:
+        message = self._message(messages, tool_names, response_format)
+        time.sleep(self._duration(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, tool_names=None, response_format=None, **kwargs) -> ChatResult:
+        message = self._message(messages, tool_names, response_format)
+        await asyncio.sleep(self._duration(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> Iterator[AIMessageChunk]:
+        if not message.tool_calls:
+            for i in range(0, len(message.content), self.chunk_chars):
+                yield AIMessageChunk(content=message.content[i:i + self.chunk_chars],
+                                     usage_metadata=message.usage_metadata if i == 0 else None)
+            return
+        tool_call = message.tool_calls[0]
+        args = json.dumps(tool_call["args"], ensure_ascii=False)
+        for i in range(0, len(args), self.chunk_chars):
+            first = i == 0
+            yield AIMessageChunk(
+                content="",
+                tool_call_chunks=[{
+                    "name": tool_call["name"] if first else None,
+                    "id": tool_call["id"] if first else None,
+                    "args": args[i:i + self.chunk_chars],
+                    "index": 0
+                }],
+                usage_metadata=message.usage_metadata if first else None
+            )
+
+    def _stream(self, messages, stop=None, run_manager=None, tool_names=None, response_format=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        message = self._message(messages, tool_names, response_format)
+        time.sleep(self.latency)
+        for chunk in self._chunks(message):
+            time.sleep(self.chunk_chars / 4 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, tool_names=None, response_format=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._message(messages, tool_names, response_format)
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(message):
+            await asyncio.sleep(self.chunk_chars / 4 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=chunk)
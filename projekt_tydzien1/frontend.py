@@ -2,34 +2,60 @@ import streamlit as st
 import requests
 import os
 from schemas import QuizQuestion, QuizConfig
+from backend_client import BackendClient
 
 # Configuration
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+BACKEND_STREAMING = os.getenv("BACKEND_STREAMING", "1") == "1"
+BACKEND_TIMEOUT = float(os.getenv("BACKEND_TIMEOUT", "90"))
+BACKEND_RETRIES = int(os.getenv("BACKEND_RETRIES", "3"))
+
+@st.cache_resource
+def get_backend_client() -> BackendClient:
+    # One pooled client shared by all reruns and browser sessions
+    return BackendClient(BACKEND_URL, timeout=(3.05, BACKEND_TIMEOUT), retries=BACKEND_RETRIES)
 
 def start_quiz_session(topic: str, num_questions: int, difficulty: str):
     config = QuizConfig(topic=topic, num_questions=num_questions, difficulty=difficulty)
     try:
-        response = requests.post(f"{BACKEND_URL}/start", json=config.model_dump())
-        response.raise_for_status()
-        return response.json()["session_id"]
+        return get_backend_client().start(config)
     except requests.exceptions.RequestException as e:
         st.error(f"Failed to connect to backend: {e}")
         return None
 
 def get_next_question(session_id: str):
     try:
-        response = requests.post(f"{BACKEND_URL}/quiz", json={"session_id": session_id})
-        response.raise_for_status()
-        return QuizQuestion(**response.json())
+        return get_backend_client().next_question(session_id)
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching question: {e}")
         return None
 
+def render_partial_question(placeholder, partial: dict):
+    lines = [f"### {partial.get('question', '')}"]
+    for key in ["a", "b", "c", "d"]:
+        if key in partial:
+            lines.append(f"- {key.upper()}) {partial[key]}")
+    placeholder.markdown("\n".join(lines))
+
+def stream_next_question(session_id: str, placeholder):
+    try:
+        for event, data in get_backend_client().stream_question(session_id):
+            if event == "partial":
+                render_partial_question(placeholder, data)
+            elif event == "question":
+                return QuizQuestion(**data)
+            elif event == "error":
+                st.error(f"Error fetching question: {data.get('detail')}")
+                return None
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching question: {e}")
+    return None
+
 def cleanup_session(session_id: str):
     if not session_id:
         return
     try:
-        requests.delete(f"{BACKEND_URL}/cleanup/{session_id}")
+        get_backend_client().cleanup(session_id)
     except:
         pass
 
@@ -77,12 +103,20 @@ def main():
 
         # Fetch question if needed
         if len(st.session_state.questions) <= current_idx:
-            with st.spinner(f"Generuję pytanie {current_idx + 1}..."):
-                q = get_next_question(st.session_state.session_id)
-                if q:
-                    st.session_state.questions.append(q)
-                else:
-                    st.stop() # Stop if failed to get question
+            if BACKEND_STREAMING:
+                # Show the question while it is generated, answers are enabled once it is validated
+                st.subheader(f"Pytanie {current_idx + 1} z {st.session_state.num_questions}")
+                placeholder = st.empty()
+                placeholder.caption(f"Generuję pytanie {current_idx + 1}...")
+                q = stream_next_question(st.session_state.session_id, placeholder)
+            else:
+                with st.spinner(f"Generuję pytanie {current_idx + 1}..."):
+                    q = get_next_question(st.session_state.session_id)
+            if q:
+                st.session_state.questions.append(q)
+                st.rerun()
+            else:
+                st.stop() # Stop if failed to get question
 
         # Display Question
         q = st.session_state.questions[current_idx]
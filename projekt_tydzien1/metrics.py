@@ -0,0 +1,287 @@
+"""Prometheus-style metrics and lightweight request spans for the backend."""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage
+
+logger = logging.getLogger("quiz.trace")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    """Gauge with either set values or a callback evaluated at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, *args, callback: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.callback = callback
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                return [f"{self.name} {self.callback()}"]
+            except Exception:
+                return []
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, data in self._values.items():
+            for bound, count in zip(self.buckets, data):
+                labels = _format_labels(self.label_names, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.label_names, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {data[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {data[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+http_request_seconds = registry.register(Histogram(
+    "quiz_http_request_duration_seconds", "HTTP request latency", ["method", "path", "status"]))
+span_seconds = registry.register(Histogram(
+    "quiz_span_duration_seconds", "Duration of request spans", ["span"]))
+model_latency_seconds = registry.register(Histogram(
+    "quiz_model_latency_seconds", "Model call latency", ["model"]))
+model_ttft_seconds = registry.register(Histogram(
+    "quiz_model_time_to_first_token_seconds", "Time to the first streamed chunk", ["model"]))
+model_errors_total = registry.register(Counter(
+    "quiz_model_errors_total", "Failed model calls", ["model"]))
+tokens_total = registry.register(Counter(
+    "quiz_tokens_total", "Tokens used by model calls; cache_read and cache_creation are part of input", ["type"]))
+session_tokens = registry.register(Histogram(
+    "quiz_session_tokens", "Tokens used per session, observed at cleanup", ["type"], buckets=TOKEN_BUCKETS))
+prompt_cache_total = registry.register(Counter(
+    "quiz_prompt_cache_total", "Model calls that read the prompt cache (hit) or not (miss)", ["result"]))
+structured_output_total = registry.register(Counter(
+    "quiz_structured_output_total", "Structured output results: ok, repaired, regenerated or failed", ["result"]))
+tier_sessions_total = registry.register(Counter(
+    "quiz_tier_sessions_total", "Sessions started per model tier", ["tier"]))
+tier_calls_total = registry.register(Counter(
+    "quiz_tier_calls_total", "Model calls per model tier", ["tier"]))
+tier_tokens_total = registry.register(Counter(
+    "quiz_tier_tokens_total", "Input and output tokens per model tier", ["tier", "type"]))
+budget_exceeded_total = registry.register(Counter(
+    "quiz_budget_exceeded_total", "Model calls refused because the session token budget was used up",
+    ["tier", "type"]))
+
+
+def loop_ready_queue() -> int:
+    """Callbacks waiting in the running event loop (CPython implementation detail)."""
+    loop = asyncio.get_running_loop()
+    return len(getattr(loop, "_ready", ()))
+
+
+def loop_tasks() -> int:
+    return len(asyncio.all_tasks())
+
+
+registry.register(Gauge(
+    "quiz_event_loop_ready_callbacks", "Callbacks ready to run in the event loop", callback=loop_ready_queue))
+registry.register(Gauge(
+    "quiz_event_loop_tasks", "Pending asyncio tasks", callback=loop_tasks))
+
+
+# Request spans
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+# Set for profiled requests (see profiling.py), collects their spans
+span_sink: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar("span_sink", default=None)
+
+
+def new_request_id() -> str:
+    request_id = uuid.uuid4().hex[:16]
+    request_id_var.set(request_id)
+    return request_id
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block, record it in `quiz_span_duration_seconds` and log it with the request id."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        span_seconds.observe(duration, span=name)
+        sink = span_sink.get()
+        if sink is not None:
+            sink.append({"span": name, "ms": round(duration * 1000, 2), **attributes})
+        logger.debug("request=%s span=%s duration_ms=%.1f %s", request_id_var.get(), name, duration * 1000,
+                     " ".join(f"{k}={v}" for k, v in attributes.items()))
+
+
+class InstrumentedHistory(BaseChatMessageHistory):
+    """Wraps a chat history to time loading and saving messages."""
+
+    def __init__(self, history: BaseChatMessageHistory):
+        self.history = history
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with span("history_load"):
+            return self.history.messages
+
+    async def aget_messages(self) -> List[BaseMessage]:
+        with span("history_load"):
+            return await self.history.aget_messages()
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with span("history_save"):
+            self.history.add_messages(messages)
+
+    async def aadd_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with span("history_save"):
+            await self.history.aadd_messages(messages)
+
+    def clear(self) -> None:
+        self.history.clear()
+
+    async def aclear(self) -> None:
+        await self.history.aclear()
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Records model latency, time to first token and token usage per model tier.
+
+    Token usage per session is kept in the session meta, see backend.record_usage.
+    """
+
+    # Cheap bookkeeping, no need to run in a thread pool
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[str, dict] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        metadata = metadata or {}
+        self._runs[str(run_id)] = {
+            "start": time.perf_counter(),
+            "first_token": None,
+            "model": metadata.get("ls_model_name") or (serialized or {}).get("name", "unknown"),
+            "tier": metadata.get("tier")
+        }
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        run = self._runs.get(str(run_id))
+        if run and run["first_token"] is None:
+            run["first_token"] = time.perf_counter()
+            model_ttft_seconds.observe(run["first_token"] - run["start"], model=run["model"])
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        run = self._runs.pop(str(run_id), None)
+        if run is None:
+            return
+        model_latency_seconds.observe(time.perf_counter() - run["start"], model=run["model"])
+        usage = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or usage
+        if run["tier"]:
+            tier_calls_total.inc(tier=run["tier"])
+        for kind in ("input", "output"):
+            count = usage.get(f"{kind}_tokens", 0)
+            tokens_total.inc(count, type=kind)
+            if run["tier"]:
+                tier_tokens_total.inc(count, tier=run["tier"], type=kind)
+        # Prompt caching, only reported by providers that support it
+        details = usage.get("input_token_details") or {}
+        if "cache_read" in details or "cache_creation" in details:
+            prompt_cache_total.inc(result="hit" if details.get("cache_read") else "miss")
+            for kind in ("cache_read", "cache_creation"):
+                tokens_total.inc(details.get(kind) or 0, type=kind)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        run = self._runs.pop(str(run_id), None)
+        model_errors_total.inc(model=run["model"] if run else "unknown")
@@ -0,0 +1,303 @@
+import asyncio
+import contextlib
+import logging
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+import metrics
+from structured_output import bind_structured, parse_structured
+
+logger = logging.getLogger(__name__)
+
+hedges_total = metrics.registry.register(metrics.Counter(
+    "quiz_llm_hedges_total", "Hedged requests sent to a secondary model", ["model"]))
+wins_total = metrics.registry.register(metrics.Counter(
+    "quiz_llm_wins_total", "Model that delivered the used response", ["model"]))
+circuit_open_total = metrics.registry.register(metrics.Counter(
+    "quiz_llm_circuit_open_total", "Circuit breaker openings", ["model"]))
+
+
+class CircuitBreaker:
+    """Stops routing to a model after `failures` consecutive errors.
+
+    After `reset_timeout` seconds one trial call is let through (half-open);
+    its success closes the circuit again, its failure keeps it open for
+    another `reset_timeout`. A trial call that is cancelled gives the trial back.
+    """
+
+    def __init__(self, failures: int = 5, reset_timeout: float = 30):
+        self.max_failures = failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if not self.trial and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.trial = True
+            return True
+        return False
+
+    def release_trial(self):
+        """The trial call ended without a result (e.g. it lost a hedge), let the next call try."""
+        self.trial = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def record_failure(self) -> bool:
+        """Returns True when this failure opened the circuit."""
+        self.failures += 1
+        if self.trial or (self.opened_at is None and self.failures >= self.max_failures):
+            self.opened_at = time.monotonic()
+            self.trial = False
+            return True
+        return False
+
+
+class ModelEntry:
+    """A model in the pool with its own health and latency statistics."""
+
+    def __init__(self, name: str, llm, breaker: CircuitBreaker, window: int = 200):
+        self.name = name
+        self.llm = llm
+        self.breaker = breaker
+        self.latencies: deque = deque(maxlen=window)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if len(self.latencies) < 10:
+            return None
+        values = sorted(self.latencies)
+        return values[min(int(p / 100 * len(values)), len(values) - 1)]
+
+    def record(self, latency: float):
+        self.latencies.append(latency)
+        self.breaker.record_success()
+
+    def fail(self):
+        if self.breaker.record_failure():
+            circuit_open_total.inc(model=self.name)
+            logger.warning("Circuit opened for model %s", self.name)
+
+
+class HedgedChatModel(Runnable):
+    """Calls the first healthy model and hedges with the next one when it is slow.
+
+    The hedge is sent once the primary has not answered within the
+    `percentile` of its recent latencies (clamped to [min_delay, max_delay]).
+    The first valid response wins and the other call is cancelled.
+    """
+
+    def __init__(self, entries: Sequence[Tuple[ModelEntry, Runnable]], validate: Callable[[AIMessage], bool],
+                 percentile: float = 95, min_delay: float = 1.0, max_delay: float = 20.0, initial_delay: float = 5.0):
+        self.entries = list(entries)
+        self.validate = validate
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.initial_delay = initial_delay
+
+    def _candidates(self) -> Iterator[Tuple[ModelEntry, Runnable]]:
+        """Models to call in order. Lazy: a circuit is only asked (and a half-open trial
+        only taken) when a call to that model is about to be made."""
+        launched = False
+        for entry, runnable in self.entries:
+            if entry.breaker.allow():
+                launched = True
+                yield entry, runnable
+        if not launched:
+            # With every circuit open, still try the primary rather than fail outright
+            yield self.entries[0]
+
+    def hedge_delay(self, entry: ModelEntry) -> float:
+        delay = entry.percentile(self.percentile)
+        if delay is None:
+            return self.initial_delay
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    async def _call(self, entry: ModelEntry, runnable: Runnable, input: Any, config: Optional[RunnableConfig]):
+        start = time.monotonic()
+        try:
+            result = await runnable.ainvoke(input, config)
+        except asyncio.CancelledError:
+            # Lost the hedge or the request was cancelled, no verdict on the model
+            entry.breaker.release_trial()
+            raise
+        except Exception:
+            entry.fail()
+            raise
+        entry.record(time.monotonic() - start)
+        return result
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AIMessage:
+        # Synchronous path: plain ordered fallback without hedging
+        error = None
+        for entry, runnable in self._candidates():
+            try:
+                start = time.monotonic()
+                result = runnable.invoke(input, config, **kwargs)
+                entry.record(time.monotonic() - start)
+                return result
+            except Exception as e:
+                entry.fail()
+                error = e
+        raise error
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AIMessage:
+        candidates = self._candidates()
+        tasks = {}
+
+        def launch() -> bool:
+            item = next(candidates, None)
+            if item is None:
+                return False
+            entry, runnable = item
+            if tasks:
+                hedges_total.inc(model=entry.name)
+            tasks[asyncio.create_task(self._call(entry, runnable, input, config))] = entry
+            return True
+
+        launch()
+        last, error = None, None
+        can_hedge = True
+        try:
+            while tasks:
+                timeout = self.hedge_delay(next(iter(tasks.values()))) if can_hedge else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    can_hedge = launch()
+                    continue
+                for task in done:
+                    entry = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if self.validate(result):
+                        wins_total.inc(model=entry.name)
+                        return result
+                    last = result
+                # Failed or invalid response: move on to the next model right away
+                if not tasks:
+                    can_hedge = launch()
+        finally:
+            for task in tasks:
+                task.cancel()
+        if last is not None:
+            return last
+        raise error
+
+    async def astream(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs) -> AsyncIterator:
+        """Hedge on the time to the first chunk, then stream the winner."""
+        candidates = self._candidates()
+        streams = {}
+
+        def launch() -> bool:
+            item = next(candidates, None)
+            if item is None:
+                return False
+            entry, runnable = item
+            if streams:
+                hedges_total.inc(model=entry.name)
+            stream = runnable.astream(input, config, **kwargs)
+            streams[asyncio.ensure_future(stream.__anext__())] = (entry, stream, time.monotonic())
+            return True
+
+        launch()
+        winner, first, error = None, None, None
+        can_hedge = True
+        try:
+            while streams and winner is None:
+                timeout = self.hedge_delay(next(iter(streams.values()))[0]) if can_hedge else None
+                done, _ = await asyncio.wait(streams, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    can_hedge = launch()
+                    continue
+                for task in done:
+                    entry, stream, start = streams.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        if not isinstance(e, StopAsyncIteration):
+                            entry.fail()
+                        error = e
+                        continue
+                    winner = (entry, stream, start)
+                    break
+                if winner is None and not streams:
+                    can_hedge = launch()
+        finally:
+            for task, (entry, _, _) in streams.items():
+                task.cancel()
+                entry.breaker.release_trial()
+            if streams:
+                # Let the cancelled reads finish before closing their streams; errors are not raised here
+                await asyncio.wait(streams)
+            for _, stream, _ in streams.values():
+                with contextlib.suppress(Exception):
+                    await stream.aclose()
+
+        if winner is None:
+            raise error or RuntimeError("No model produced a response")
+        entry, stream, start = winner
+        wins_total.inc(model=entry.name)
+        yield first
+        try:
+            async for chunk in stream:
+                yield chunk
+        except Exception:
+            entry.fail()
+            raise
+        except BaseException:
+            # Closed or cancelled by the caller before the end
+            entry.breaker.release_trial()
+            raise
+        entry.record(time.monotonic() - start)
+
+
+class ModelPool:
+    """Ordered pool of models: the first is the primary, the rest are hedges/fallbacks."""
+
+    def __init__(self, models: Sequence[Tuple[str, Any]], failures: int = 5, reset_timeout: float = 30,
+                 percentile: float = 95, min_delay: float = 1.0, max_delay: float = 20.0, initial_delay: float = 5.0):
+        self.entries = [ModelEntry(name, llm, CircuitBreaker(failures, reset_timeout)) for name, llm in models]
+        self.hedge_options = dict(percentile=percentile, min_delay=min_delay, max_delay=max_delay,
+                                  initial_delay=initial_delay)
+
+    def bind_structured(self, schema, strategy: str = "auto", callbacks: Optional[list] = None,
+                        prepare: Optional[Callable[[str], Optional[Runnable]]] = None) -> Runnable:
+        """Bind `schema` as structured output of every model; with a single model the plain bound model is returned.
+
+        The output strategy is resolved per model (see structured_output.py).
+        `prepare(name)` may return a stage to run in front of that model only,
+        e.g. provider-specific prompt caching marks.
+        """
+        bound = []
+        for entry in self.entries:
+            runnable = bind_structured(entry.llm, schema, strategy)
+            if callbacks:
+                runnable = runnable.with_config(callbacks=callbacks)
+            stage = prepare(entry.name) if prepare else None
+            if stage is not None:
+                runnable = stage | runnable
+            bound.append((entry, runnable))
+        if len(bound) == 1:
+            return bound[0][1]
+
+        def validate(message: AIMessage) -> bool:
+            return parse_structured(message, schema) is not None
+
+        return HedgedChatModel(bound, validate, **self.hedge_options)
@@ -0,0 +1,130 @@
+import asyncio
+import contextlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from schemas import QuizQuestion
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPrefetch:
+    """Ready questions and the background task that fills them for one session."""
+
+    def __init__(self, depth: int, limit: Optional[int]):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=depth)
+        # Generation must be serialized per session, history is appended in order
+        self.lock = asyncio.Lock()
+        self.task: Optional[asyncio.Task] = None
+        self.limit = limit
+        self.generated = 0
+
+    def can_generate(self) -> bool:
+        return self.limit is None or self.generated < self.limit
+
+
+class Prefetcher:
+    """Keeps a small queue of questions generated ahead of the user.
+
+    State is per process: a session served by another worker simply
+    falls back to generating on demand.
+    """
+
+    def __init__(self, generate: Callable[[str], Awaitable[QuizQuestion]], depth: int = 1, max_sessions: int = 1000):
+        self.generate = generate
+        self.depth = depth
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionPrefetch]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.depth > 0
+
+    def open(self, session_id: str, limit: Optional[int] = None):
+        """Register a session and start generating its first questions."""
+        if not self.enabled:
+            return
+        self._sessions[session_id] = SessionPrefetch(self.depth, limit)
+        while len(self._sessions) > self.max_sessions:
+            _, state = self._sessions.popitem(last=False)
+            if state.task:
+                state.task.cancel()
+        self.refill(session_id)
+
+    def lock(self, session_id: str):
+        state = self._sessions.get(session_id)
+        return state.lock if state else contextlib.nullcontext()
+
+    async def get(self, session_id: str) -> QuizQuestion:
+        state = self._sessions.get(session_id)
+        if state is None:
+            return await self.generate(session_id)
+        self._sessions.move_to_end(session_id)
+
+        question = self.ready(session_id)
+        if question is None:
+            async with state.lock:
+                # A prefetch may have finished while we waited for the lock
+                question = self.ready(session_id)
+                if question is None:
+                    self.reserve(session_id)
+                    try:
+                        question = await self.generate(session_id)
+                    except BaseException:
+                        self.release(session_id)
+                        raise
+
+        self.refill(session_id)
+        return question
+
+    def ready(self, session_id: str) -> Optional[QuizQuestion]:
+        """Pop an already generated question, if any."""
+        state = self._sessions.get(session_id)
+        if state is None or state.queue.empty():
+            return None
+        return state.queue.get_nowait()
+
+    def reserve(self, session_id: str):
+        """Count a question generated on demand against the session limit."""
+        state = self._sessions.get(session_id)
+        if state is not None:
+            state.generated += 1
+
+    def release(self, session_id: str):
+        """Give back a reservation whose generation failed."""
+        state = self._sessions.get(session_id)
+        if state is not None:
+            state.generated -= 1
+
+    def refill(self, session_id: str):
+        state = self._sessions.get(session_id)
+        if state is None or state.queue.full() or not state.can_generate():
+            return
+        if state.task is None or state.task.done():
+            state.task = asyncio.create_task(self._fill(session_id, state))
+
+    async def _fill(self, session_id: str, state: SessionPrefetch):
+        while not state.queue.full() and state.can_generate():
+            async with state.lock:
+                state.generated += 1
+                try:
+                    question = await self.generate(session_id)
+                except asyncio.CancelledError:
+                    raise
+                except Exception:
+                    # The next /quiz call will generate on demand
+                    state.generated -= 1
+                    logger.warning("Prefetch failed for session %s", session_id, exc_info=True)
+                    return
+            await state.queue.put(question)
+
+    async def close(self, session_id: str, cancel: bool = True):
+        """Forget a session; cancel its in-flight generation or wait for it."""
+        state = self._sessions.pop(session_id, None)
+        if state is None or state.task is None or state.task.done():
+            return
+        if cancel:
+            state.task.cancel()
+        with contextlib.suppress(Exception, asyncio.CancelledError):
+            await state.task
@@ -0,0 +1,179 @@
+"""On-demand profiling of single backend requests.
+
+A profiled request produces three files in the profile directory:
+
+- `<name>.collapsed`: wall-clock samples of the event loop thread in collapsed
+  stack format (open in speedscope or flamegraph.pl); time spent waiting for
+  I/O shows up under the selector's `select` frame
+- `<name>.prof`: cProfile stats of the loop thread (`python -m pstats`, snakeviz)
+- `<name>.json`: summary with wall and CPU time, request spans and top allocations
+
+The loop thread is shared, so both profiles also contain whatever other
+requests ran at the same time. Only one request is profiled at a time.
+"""
+import cProfile
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter as CounterDict
+from typing import Dict, List, Optional
+
+import metrics
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackSampler(threading.Thread):
+    """Samples the stack of another thread every `interval` seconds."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        super().__init__(daemon=True, name="profile-sampler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: CounterDict = CounterDict()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ProfileRun:
+    """Profilers active for one request."""
+
+    def __init__(self, name: str, sample_interval: float, trace_allocations: bool):
+        self.name = name
+        self.spans: List[dict] = []
+        # Inherited by the tasks of this request, collects its spans
+        metrics.span_sink.set(self.spans)
+        self.sampler = StackSampler(threading.get_ident(), sample_interval)
+        self.profile = cProfile.Profile()
+        # tracemalloc may already be running (e.g. in the benchmark), then it is left on
+        self.own_tracemalloc = trace_allocations and not tracemalloc.is_tracing()
+        if self.own_tracemalloc:
+            tracemalloc.start()
+        self.snapshot = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+        self.sampler.start()
+        self.profile.enable()
+
+    def stop(self, directory: str, info: dict) -> dict:
+        self.profile.disable()
+        self.sampler.stop()
+        summary = dict(info)
+        summary["wall_seconds"] = round(time.perf_counter() - self.wall_start, 6)
+        summary["cpu_seconds"] = round(time.thread_time() - self.cpu_start, 6)
+        summary["samples"] = sum(self.sampler.stacks.values())
+        summary["spans"] = self.spans
+        if self.snapshot is not None:
+            stats = tracemalloc.take_snapshot().compare_to(self.snapshot, "lineno")
+            summary["allocations"] = [
+                {"location": str(stat.traceback[0]), "size_kib": round(stat.size_diff / 1024, 1),
+                 "count": stat.count_diff}
+                for stat in stats[:20] if stat.size_diff > 0
+            ]
+            if self.own_tracemalloc:
+                tracemalloc.stop()
+
+        base = os.path.join(directory, self.name)
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            f.write(self.sampler.collapsed())
+        self.profile.dump_stats(base + ".prof")
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+class RequestProfiler:
+    """Decides which requests to profile and keeps the profile directory bounded.
+
+    Requests are profiled when they carry the admin token in the trigger header
+    or are picked at random with `sample_rate`. Without a token profiling is off.
+    """
+
+    def __init__(self, directory: str = "profiles", token: str = "", sample_rate: float = 0.0,
+                 sample_interval: float = 0.005, trace_allocations: bool = True, max_profiles: int = 100,
+                 excluded_paths=("/metrics", "/healthz", "/readyz", "/admin/")):
+        self.directory = directory
+        self.token = token
+        self.sample_rate = sample_rate
+        self.sample_interval = sample_interval
+        self.trace_allocations = trace_allocations
+        self.max_profiles = max_profiles
+        self.excluded_paths = tuple(excluded_paths)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token)
+
+    def wants(self, path: str, header: Optional[str]) -> bool:
+        if not self.enabled or path.startswith(self.excluded_paths):
+            return False
+        if header is not None:
+            return self.check_token(header)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def check_token(self, token: Optional[str]) -> bool:
+        return self.enabled and token is not None and hmac.compare_digest(token, self.token)
+
+    def start(self, request_id: str, path: str) -> Optional[ProfileRun]:
+        """Start profiling, or None when another request is being profiled."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            slug = path.strip("/").replace("/", "_") or "root"
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{request_id}"
+            return ProfileRun(name, self.sample_interval, self.trace_allocations)
+        except Exception:
+            self._lock.release()
+            raise
+
+    def finish(self, run: ProfileRun, info: dict) -> dict:
+        try:
+            return run.stop(self.directory, info)
+        finally:
+            self._lock.release()
+            self.prune()
+
+    def profiles(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def prune(self):
+        """Remove the oldest profiles beyond `max_profiles`."""
+        names = self.profiles()
+        for name in names[:max(len(names) - self.max_profiles, 0)]:
+            for ext in (".json", ".prof", ".collapsed"):
+                try:
+                    os.remove(os.path.join(self.directory, name + ext))
+                except FileNotFoundError:
+                    pass
+
+    def settings(self) -> Dict[str, object]:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "sample_interval": self.sample_interval,
+                "trace_allocations": self.trace_allocations, "directory": self.directory}
@@ -0,0 +1,49 @@
+from typing import List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def _blocks(message: BaseMessage) -> list:
+    if isinstance(message.content, str):
+        return [{"type": "text", "text": message.content}] if message.content else []
+    return [block if isinstance(block, dict) else {"type": "text", "text": block} for block in message.content]
+
+
+def with_breakpoint(message: BaseMessage, index: int = -1) -> Optional[BaseMessage]:
+    """Copy of the message with a cache breakpoint on one content block, None if it has no text."""
+    blocks = _blocks(message)
+    if not blocks or (blocks[index].get("type") == "text" and not blocks[index].get("text")):
+        return None
+    blocks = list(blocks)
+    blocks[index] = {**blocks[index], "cache_control": CACHE_CONTROL}
+    return message.model_copy(update={"content": blocks})
+
+
+def mark_cacheable(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Mark the stable prompt prefix and the history up to the previous turn as cacheable.
+
+    Breakpoints go on the first block of the system prompt (the provider caches
+    the tool schema, if any, in front of it) and on the last message before the
+    current request. The compaction digest is part of the current request, so a
+    changing digest does not invalidate the cached prefix.
+    """
+    messages = list(messages)
+    if messages and isinstance(messages[0], SystemMessage):
+        messages[0] = with_breakpoint(messages[0], 0) or messages[0]
+
+    last_human = next((i for i in range(len(messages) - 1, -1, -1) if isinstance(messages[i], HumanMessage)), None)
+    # AI messages with only a tool call (older histories) have no block to mark
+    for i in range((last_human or 1) - 1, 0, -1):
+        marked = with_breakpoint(messages[i])
+        if marked is not None:
+            messages[i] = marked
+            break
+    return messages
+
+
+def prompt_cache_stage() -> RunnableLambda:
+    """Runnable stage to put in front of a model that supports `cache_control` (Anthropic)."""
+    return RunnableLambda(mark_cacheable, name="mark_cacheable")
@@ -0,0 +1,82 @@
+import random
+import re
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+
+from schemas import QuizQuestion
+
+
+def normalize_question(text: str) -> str:
+    return re.sub(r"[\W_]+", " ", text.lower()).strip()
+
+
+def similarity(a: str, b: str) -> float:
+    """Jaccard similarity of the word sets of two normalized texts."""
+    words_a, words_b = set(a.split()), set(b.split())
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+class QuestionBank:
+    """Validated questions grouped by normalized (topic, difficulty).
+
+    Topics are evicted least recently used first; within a topic the
+    oldest questions are dropped once `max_per_topic` is reached.
+    """
+
+    def __init__(self, max_topics: int = 200, max_per_topic: int = 200, similarity_threshold: float = 0.8):
+        self.max_topics = max_topics
+        self.max_per_topic = max_per_topic
+        self.similarity_threshold = similarity_threshold
+        self._banks: "OrderedDict[Tuple[str, str], List[Tuple[str, QuizQuestion]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(topic: str, difficulty: str) -> Tuple[str, str]:
+        return normalize_question(topic), difficulty.strip().lower()
+
+    def is_duplicate(self, text: str, others: Iterable[str]) -> bool:
+        return any(text == other or similarity(text, other) >= self.similarity_threshold for other in others)
+
+    def add(self, topic: str, difficulty: str, question: QuizQuestion) -> bool:
+        """Store a question, returns False for near duplicates."""
+        text = normalize_question(question.question)
+        if not text:
+            return False
+        key = self.key(topic, difficulty)
+        with self._lock:
+            bank = self._banks.setdefault(key, [])
+            self._banks.move_to_end(key)
+            if self.is_duplicate(text, (other for other, _ in bank)):
+                return False
+            bank.append((text, question))
+            del bank[:-self.max_per_topic]
+            while len(self._banks) > self.max_topics:
+                self._banks.popitem(last=False)
+        return True
+
+    def sample_many(self, topic: str, difficulty: str, count: int, exclude: Iterable[str] = ()) -> List[QuizQuestion]:
+        """Up to `count` random stored questions not similar to the excluded texts or to each other."""
+        key = self.key(topic, difficulty)
+        with self._lock:
+            bank = self._banks.get(key)
+            if not bank:
+                return []
+            self._banks.move_to_end(key)
+            candidates = list(bank)
+        random.shuffle(candidates)
+
+        taken = list(exclude)
+        result = []
+        for text, question in candidates:
+            if len(result) >= count:
+                break
+            if not self.is_duplicate(text, taken):
+                taken.append(text)
+                result.append(question)
+        return result
+
+    def __len__(self) -> int:
+        return sum(len(bank) for bank in self._banks.values())
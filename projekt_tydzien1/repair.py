@@ -0,0 +1,120 @@
+"""Local recovery of a QuizQuestion from malformed model output."""
+import json
+import re
+from typing import Any, Iterator, Optional
+
+from langchain_core.messages import AIMessage
+from langchain_core.utils.json import parse_partial_json
+from pydantic import ValidationError
+
+from schemas import QuizQuestion
+from structured_output import message_text
+
+OPTION_KEYS = ["a", "b", "c", "d"]
+QUESTION_KEYS = ["question", "pytanie", "tresc", "treść", "text"]
+ANSWER_KEYS = ["correct_answer", "correct", "answer", "poprawna", "poprawna_odpowiedz", "odpowiedz", "odpowiedź"]
+OPTION_LINE = re.compile(r"^\s*(?:opcja\s+)?\(?([a-dA-D])\s*[\).:\-]\s*(.+?)\s*$")
+ANSWER_LINE = re.compile(r"(?:poprawna(?:\s+odpowied[zź])?|odpowied[zź]|correct(?:\s+answer)?|answer)\s*[:\-]\s*(.+)", re.I)
+
+
+def normalize_answer(value: Any, options: Optional[dict] = None) -> Optional[str]:
+    """Map "A", "a)", "Opcja A", "(c)" or the text of an option to a letter."""
+    if value is None:
+        return None
+    text = str(value).strip()
+    match = re.fullmatch(r"(?:opcja|odpowied[zź]|option|answer)?\s*[\(\[]?\s*([a-dA-D])\s*[\)\]\.:]?", text, re.I)
+    if match:
+        return match.group(1).lower()
+    if options:
+        for key in OPTION_KEYS:
+            if options.get(key) and str(options[key]).strip().lower() == text.lower():
+                return key
+    return None
+
+
+def extract_json(text: str) -> Optional[dict]:
+    """First JSON object in a text: a fenced block or the outermost braces."""
+    fenced = re.search(r"```(?:json)?\s*(\{.*?\})\s*```", text, re.S)
+    candidates = [fenced.group(1)] if fenced else []
+    start = text.find("{")
+    if start != -1:
+        candidates.append(text[start:text.rfind("}") + 1] or text[start:])
+    for candidate in candidates:
+        try:
+            data = json.loads(candidate)
+        except ValueError:
+            data = parse_partial_json(candidate)
+        if isinstance(data, dict):
+            return data
+    return None
+
+
+def parse_enumerated(text: str) -> Optional[dict]:
+    """Read a question written as plain text with options A) ... D)."""
+    question_lines, options, answer = [], {}, None
+    for line in text.splitlines():
+        option = OPTION_LINE.match(line)
+        answer_match = ANSWER_LINE.search(line)
+        if option and len(options) < 4:
+            options[option.group(1).lower()] = option.group(2)
+        elif answer_match and options:
+            answer = answer_match.group(1)
+        elif line.strip() and not options:
+            question_lines.append(re.sub(r"^\s*(?:pytanie(?:\s*\d+)?\s*:)\s*", "", line.strip(), flags=re.I))
+    if not question_lines or len(options) < 4:
+        return None
+    return {"question": " ".join(question_lines), **options, "correct_answer": answer}
+
+
+def repair_args(data: Any) -> Optional[QuizQuestion]:
+    """Coerce a dict with known field variants into a valid QuizQuestion."""
+    if not isinstance(data, dict):
+        return None
+    data = {str(k).lower(): v for k, v in data.items()}
+    question = next((data[k] for k in QUESTION_KEYS if data.get(k)), None)
+
+    options = {k: data[k] for k in OPTION_KEYS if data.get(k)}
+    listed = data.get("options") or data.get("opcje")
+    if isinstance(listed, dict):
+        options = {str(k).lower()[:1]: v for k, v in listed.items()}
+    elif isinstance(listed, list) and len(listed) == 4:
+        options = dict(zip(OPTION_KEYS, listed))
+
+    answer = normalize_answer(next((data[k] for k in ANSWER_KEYS if data.get(k) is not None), None), options)
+    try:
+        return QuizQuestion(question=question, correct_answer=answer, **{k: str(options.get(k)) for k in OPTION_KEYS if options.get(k)})
+    except (ValidationError, TypeError):
+        return None
+
+
+def _candidates(message: AIMessage) -> Iterator[Any]:
+    for tool_call in message.tool_calls or []:
+        yield tool_call.get("args")
+    for tool_call in getattr(message, "invalid_tool_calls", None) or []:
+        yield extract_json(tool_call.get("args") or "")
+    text = message_text(message)
+    if text:
+        yield extract_json(text)
+        yield parse_enumerated(text)
+
+
+def repair_question(message: AIMessage) -> Optional[QuizQuestion]:
+    """Try to recover a QuizQuestion from tool-call args, JSON in the text or enumerated text."""
+    for candidate in _candidates(message):
+        question = repair_args(candidate)
+        if question is not None:
+            return question
+    return None
+
+
+def correction_prompt(message: AIMessage) -> str:
+    """Minimal prompt asking the model to fix its own output, without the session history."""
+    parts = [message_text(message)]
+    parts += [json.dumps(tc.get("args"), ensure_ascii=False) for tc in message.tool_calls or []]
+    parts += [tc.get("args") or "" for tc in getattr(message, "invalid_tool_calls", None) or []]
+    output = "\n".join(p for p in parts if p).strip() or "(pusta odpowiedź)"
+    return (
+        "Poniższa odpowiedź miała zawierać pytanie quizowe, ale ma niepoprawny format. "
+        "Zwróć to samo pytanie (albo nowe, jeśli nie da się go odczytać) wyłącznie w wymaganym formacie QuizQuestion: "
+        "treść pytania, cztery opcje a-d i literę poprawnej odpowiedzi.\n\n" + output
+    )
@@ -0,0 +1,101 @@
+"""Routing of quiz sessions to model tiers by difficulty and topic.
+
+A tier is a model (with optional fallbacks) plus its temperature, reply
+token limit and per-session token budget. The routing file (LLM_ROUTING_FILE)
+is JSON, see routing.example.json:
+
+- `tiers`: tier name -> `model` ("provider:model"), optional `fallbacks`,
+  `temperature`, `max_tokens`, `max_input_tokens`, `max_output_tokens`
+- `topics`: list of `{"pattern": ..., "tier": ...}`, regular expressions
+  matched case-insensitively against the quiz topic, checked first
+- `difficulty`: difficulty -> tier name
+- `default`: tier for everything else
+
+Without a routing file there is a single `default` tier built from the
+LLM_* variables, as before.
+"""
+import json
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+
+class ModelTier:
+    """Model settings and per-session token budget of one tier; a limit of 0 means no limit."""
+
+    def __init__(self, name: str, model: str, fallbacks: Sequence[str] = (), temperature: float = 0.8,
+                 max_tokens: Optional[int] = None, max_input_tokens: int = 0, max_output_tokens: int = 0):
+        if ":" not in model:
+            raise ValueError(f"Tier {name!r}: model must be 'provider:model', got {model!r}")
+        self.name = name
+        self.model = model
+        self.fallbacks = list(fallbacks)
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.max_input_tokens = max_input_tokens
+        self.max_output_tokens = max_output_tokens
+
+    @property
+    def models(self) -> List[str]:
+        """Model specs in the order of use: the tier model, then its fallbacks."""
+        return [self.model] + self.fallbacks
+
+    def budget(self) -> Dict[str, int]:
+        return {"input": self.max_input_tokens, "output": self.max_output_tokens}
+
+    def exhausted(self, usage: Dict[str, int]) -> Optional[str]:
+        """The token type ("input" or "output") whose budget is used up, None while within budget."""
+        for kind, limit in self.budget().items():
+            if limit and usage.get(kind, 0) >= limit:
+                return kind
+        return None
+
+
+class ModelRouter:
+    """Picks the tier of a new session: topic rules first, then difficulty, then the default tier."""
+
+    def __init__(self, tiers: Dict[str, ModelTier], default: str, difficulty: Optional[Dict[str, str]] = None,
+                 topics: Optional[List[dict]] = None):
+        self.tiers = tiers
+        self.default = default
+        self.difficulty = dict(difficulty or {})
+        self.topics = [(re.compile(rule["pattern"], re.I), rule["tier"]) for rule in topics or []]
+        for name in [default, *self.difficulty.values(), *(tier for _, tier in self.topics)]:
+            if name not in tiers:
+                raise ValueError(f"Unknown model tier: {name}")
+
+    def route(self, topic: str, difficulty: str) -> ModelTier:
+        for pattern, name in self.topics:
+            if pattern.search(topic):
+                return self.tiers[name]
+        return self.tiers[self.difficulty.get(difficulty, self.default)]
+
+    def tier(self, name: Optional[str]) -> ModelTier:
+        # Sessions started before the routing changed fall back to the default tier
+        return self.tiers.get(name) or self.tiers[self.default]
+
+    @classmethod
+    def from_dict(cls, data: dict, defaults: dict) -> "ModelRouter":
+        """Build from the routing file contents; `defaults` fill settings a tier leaves out."""
+        tiers = {name: ModelTier(name, **{**defaults, **settings}) for name, settings in data["tiers"].items()}
+        default = data.get("default") or next(iter(tiers))
+        return cls(tiers, default, data.get("difficulty"), data.get("topics"))
+
+
+def create_router() -> ModelRouter:
+    """Build the router from LLM_ROUTING_FILE, or a single tier from the LLM_* variables."""
+    max_tokens = int(os.getenv("LLM_MAX_TOKENS", "0")) or None
+    defaults = {
+        "temperature": float(os.getenv("LLM_TEMPERATURE", "0.8")),
+        "max_tokens": max_tokens,
+        "max_input_tokens": int(os.getenv("SESSION_MAX_INPUT_TOKENS", "0")),
+        "max_output_tokens": int(os.getenv("SESSION_MAX_OUTPUT_TOKENS", "0"))
+    }
+    path = os.getenv("LLM_ROUTING_FILE", "")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return ModelRouter.from_dict(json.load(f), defaults)
+
+    fallbacks = [spec.strip() for spec in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if spec.strip()]
+    tier = ModelTier("default", f"{os.getenv('LLM_PROVIDER')}:{os.getenv('LLM_MODEL')}", fallbacks, **defaults)
+    return ModelRouter({"default": tier}, "default")
@@ -0,0 +1,169 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+
+class QueueFull(Exception):
+    """Raised when the scheduler sheds load, `retry_after` is a hint in seconds."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"LLM queue is full, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` units per minute (0 = unlimited)."""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        if self.per_minute <= 0:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.per_minute
+
+    def consume(self, amount: float):
+        """Take tokens; negative amounts give them back. The balance may go below zero."""
+        if self.per_minute > 0:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    name = type(error).__name__
+    return status in (429, 529) or "RateLimit" in name or "Overloaded" in name
+
+
+def retry_after_hint(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class FairScheduler:
+    """Admission control for model calls.
+
+    Limits concurrent calls and requests/tokens per minute, serves waiting
+    sessions round-robin so one busy session cannot starve the others, and
+    sheds load with `QueueFull` once `max_queue` calls are waiting.
+    """
+
+    def __init__(self, max_concurrency: int = 32, max_queue: int = 100, requests_per_minute: float = 0,
+                 tokens_per_minute: float = 0, retries: int = 3, backoff: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.retries = retries
+        self.backoff = backoff
+        self.active = 0
+        self.waiting = 0
+        self.avg_hold = 1.0
+        self._queues: "OrderedDict[str, Deque[Tuple[asyncio.Future, float]]]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def retry_after(self) -> float:
+        """Rough time until a queued call would be served."""
+        return max(1.0, self.waiting / max(self.max_concurrency, 1) * self.avg_hold)
+
+    def _dispatch(self):
+        while self.active < self.max_concurrency and self._queues:
+            session_id, queue = next(iter(self._queues.items()))
+            future, tokens = queue[0]
+            if future.cancelled():
+                queue.popleft()
+            else:
+                wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if wait > 0:
+                    if self._timer is None:
+                        self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                    return
+                queue.popleft()
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+                self.active += 1
+                self.waiting -= 1
+                future.set_result(None)
+            # Round-robin: the served session goes to the back of the line
+            if queue:
+                self._queues.move_to_end(session_id)
+            else:
+                del self._queues[session_id]
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    async def acquire(self, session_id: str, tokens: float = 0):
+        if self.waiting >= self.max_queue:
+            raise QueueFull(self.retry_after())
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(session_id, deque()).append((future, tokens))
+        self.waiting += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just before cancellation
+                self.release()
+            else:
+                self.waiting -= 1
+                self._dispatch()
+            raise
+
+    def release(self, held: Optional[float] = None):
+        self.active -= 1
+        if held is not None:
+            self.avg_hold = 0.9 * self.avg_hold + 0.1 * held
+        self._dispatch()
+
+    def record_usage(self, actual_tokens: float, estimated_tokens: float):
+        """Correct the token bucket once the real usage of a call is known."""
+        self.tokens.consume(actual_tokens - estimated_tokens)
+
+    async def take(self, tokens: float = 0):
+        """Wait for and take request and token budget for a call that already holds a slot."""
+        while True:
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        self.requests.consume(1)
+        self.tokens.consume(tokens)
+
+    async def call_with_retries(self, fn: Callable[[], Awaitable], tokens: float = 0,
+                                on_throttle: Optional[Callable[[], None]] = None):
+        """Run `fn`, retrying provider throttling errors with jittered exponential backoff.
+
+        Each retry is another request to the provider, so it takes from the
+        per-minute limits again (`tokens` is the estimate of one call).
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt == self.retries or not is_rate_limit_error(e):
+                    raise
+                if on_throttle:
+                    on_throttle()
+                delay = retry_after_hint(e) or self.backoff * 2 ** attempt
+                await asyncio.sleep(random.uniform(delay / 2, delay * 1.5))
+                await self.take(tokens)
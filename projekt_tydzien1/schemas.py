@@ -1,4 +1,4 @@
-from typing import Literal
+from typing import List, Literal
 from pydantic import BaseModel, Field
 
 class QuizQuestion(BaseModel):
@@ -13,3 +13,6 @@ class QuizConfig(BaseModel):
     topic: str
     difficulty: str = "Średni"
     num_questions: int = 3
+
+class QuizBatch(BaseModel):
+    questions: List[QuizQuestion] = Field(description="Lista pytań quizu, każde pytanie inne")
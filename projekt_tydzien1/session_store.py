@@ -0,0 +1,377 @@
+import json
+from abc import ABC, abstractmethod
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import (
+    AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage, message_to_dict, messages_from_dict
+)
+
+
+def serialize_message(message: BaseMessage) -> str:
+    """Compact JSON form of a history message, smaller than `message_to_dict`."""
+    if isinstance(message, SystemMessage):
+        data = {"t": "s", "c": message.content}
+    elif isinstance(message, HumanMessage):
+        data = {"t": "h", "c": message.content}
+    elif isinstance(message, AIMessage):
+        data = {"t": "a", "c": message.content}
+        if message.tool_calls:
+            data["tc"] = [[tc["id"], tc["name"], tc["args"]] for tc in message.tool_calls]
+    elif isinstance(message, ToolMessage):
+        data = {"t": "t", "c": message.content, "id": message.tool_call_id}
+    else:
+        data = {"t": "x", "m": message_to_dict(message)}
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def deserialize_message(raw) -> BaseMessage:
+    data = json.loads(raw)
+    kind = data["t"]
+    if kind == "s":
+        return SystemMessage(content=data["c"])
+    if kind == "h":
+        return HumanMessage(content=data["c"])
+    if kind == "a":
+        tool_calls = [{"id": id_, "name": name, "args": args} for id_, name, args in data.get("tc", [])]
+        return AIMessage(content=data["c"], tool_calls=tool_calls)
+    if kind == "t":
+        return ToolMessage(content=data["c"], tool_call_id=data["id"])
+    return messages_from_dict([data["m"]])[0]
+
+
+class SessionStore(ABC):
+    """Base class for session stores used by `get_session_history`."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @abstractmethod
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        """Return history for a session, creating it if missing."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def set_meta(self, session_id: str, meta: dict):
+        """Attach small JSON-serializable data (e.g. the quiz config) to a session."""
+
+    @abstractmethod
+    def get_meta(self, session_id: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """Remove expired sessions, returns the number of removed sessions."""
+
+    @abstractmethod
+    def __contains__(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+    def start_sweeper(self, interval: float):
+        """Remove expired sessions every `interval` seconds in a background thread until `stop_sweeper`."""
+        if self._sweeper is not None:
+            return
+        self._stop.clear()
+
+        def run():
+            while not self._stop.wait(interval):
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join()
+            self._sweeper = None
+
+
+class InMemorySessionStore(SessionStore):
+    """LRU + TTL bounded store keeping histories in process memory."""
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600):
+        super().__init__(ttl)
+        self.max_sessions = max_sessions
+        # session_id -> [history, last_access, meta]
+        self._sessions: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expired(self, last_access: float, now: float) -> bool:
+        return self.ttl > 0 and now - last_access > self.ttl
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or self._expired(entry[1], now):
+                entry = [InMemoryChatMessageHistory(), now, None]
+                self._sessions[session_id] = entry
+            entry[1] = now
+            self._sessions.move_to_end(session_id)
+            # Evict least recently used sessions
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return entry[0]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def set_meta(self, session_id: str, meta: dict):
+        self.get(session_id)
+        with self._lock:
+            self._sessions[session_id][2] = meta
+
+    def get_meta(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry[2] if entry else None
+
+    def sweep(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired = [sid for sid, (_, last, _) in self._sessions.items() if self._expired(last, now)]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            return entry is not None and not self._expired(entry[1], time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat history stored as rows in a SQLite database."""
+
+    def __init__(self, store: "SQLiteSessionStore", session_id: str):
+        self.store = store
+        self.session_id = session_id
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with closing(self.store.connect()) as conn:
+            rows = conn.execute(
+                "SELECT data FROM messages WHERE session_id = ? ORDER BY id",
+                (self.session_id,)
+            ).fetchall()
+        return [deserialize_message(row[0]) for row in rows]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        with closing(self.store.connect()) as conn, conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, data) VALUES (?, ?)",
+                [(self.session_id, serialize_message(m)) for m in messages]
+            )
+
+    def clear(self) -> None:
+        with closing(self.store.connect()) as conn, conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+
+
+class SQLiteSessionStore(SessionStore):
+    """Disk-backed store, sessions survive a worker restart.
+
+    The database runs in WAL mode, so several uvicorn workers on one host
+    can share it safely.
+    """
+
+    def __init__(self, path: str = "sessions.db", ttl: float = 3600):
+        super().__init__(ttl)
+        self.path = path
+        with closing(self.connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, last_access REAL NOT NULL, meta TEXT)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if "meta" not in columns:
+                conn.execute("ALTER TABLE sessions ADD COLUMN meta TEXT")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_session ON messages (session_id)")
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _cutoff(self) -> float:
+        return time.time() - self.ttl if self.ttl > 0 else float("-inf")
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        with closing(self.connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is not None and row[0] < self._cutoff():
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+                conn.execute("UPDATE sessions SET meta = NULL WHERE session_id = ?", (session_id,))
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, time.time())
+            )
+        return SQLiteChatMessageHistory(self, session_id)
+
+    def delete(self, session_id: str) -> bool:
+        with closing(self.connect()) as conn, conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            return conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def set_meta(self, session_id: str, meta: dict):
+        self.get(session_id)
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "UPDATE sessions SET meta = ? WHERE session_id = ?",
+                (json.dumps(meta, ensure_ascii=False), session_id)
+            )
+
+    def get_meta(self, session_id: str) -> Optional[dict]:
+        with closing(self.connect()) as conn:
+            row = conn.execute("SELECT meta FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def sweep(self) -> int:
+        cutoff = self._cutoff()
+        with closing(self.connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE last_access < ?)", (cutoff,)
+            )
+            return conn.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,)).rowcount
+
+    def __contains__(self, session_id: str) -> bool:
+        with closing(self.connect()) as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ? AND last_access >= ?",
+                (session_id, self._cutoff())
+            ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        with closing(self.connect()) as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisChatMessageHistory(BaseChatMessageHistory):
+    """Chat history stored as a Redis list of compact JSON messages."""
+
+    def __init__(self, store: "RedisSessionStore", session_id: str):
+        self.store = store
+        self.key = store.key(session_id)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [deserialize_message(raw) for raw in self.store.client.lrange(self.key, 0, -1)]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        if not messages:
+            return
+        pipe = self.store.client.pipeline()
+        pipe.rpush(self.key, *[serialize_message(m) for m in messages])
+        if self.store.ttl > 0:
+            pipe.expire(self.key, int(self.store.ttl))
+        pipe.execute()
+
+    def clear(self) -> None:
+        self.store.client.delete(self.key)
+
+
+class RedisSessionStore(SessionStore):
+    """Store shared by all workers and replicas through a Redis-protocol server.
+
+    Any client with the redis-py interface works, e.g. a fakeredis instance
+    or a client connected to Valkey/KeyDB. Expiry is handled by the server.
+    """
+
+    def __init__(self, client, ttl: float = 3600, prefix: str = "quiz:session:", meta_prefix: str = "quiz:meta:"):
+        super().__init__(ttl)
+        self.client = client
+        self.prefix = prefix
+        self.meta_prefix = meta_prefix
+
+    @classmethod
+    def from_url(cls, url: str, ttl: float = 3600) -> "RedisSessionStore":
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("SESSION_STORE=redis requires the redis package: pip install redis")
+        return cls(redis.Redis.from_url(url), ttl=ttl)
+
+    def key(self, session_id: str) -> str:
+        return self.prefix + session_id
+
+    def get(self, session_id: str) -> BaseChatMessageHistory:
+        if self.ttl > 0:
+            pipe = self.client.pipeline()
+            pipe.expire(self.key(session_id), int(self.ttl))
+            pipe.expire(self.meta_prefix + session_id, int(self.ttl))
+            pipe.execute()
+        return RedisChatMessageHistory(self, session_id)
+
+    def delete(self, session_id: str) -> bool:
+        return self.client.delete(self.key(session_id), self.meta_prefix + session_id) > 0
+
+    def set_meta(self, session_id: str, meta: dict):
+        self.client.set(
+            self.meta_prefix + session_id,
+            json.dumps(meta, ensure_ascii=False),
+            ex=int(self.ttl) if self.ttl > 0 else None
+        )
+
+    def get_meta(self, session_id: str) -> Optional[dict]:
+        raw = self.client.get(self.meta_prefix + session_id)
+        return json.loads(raw) if raw else None
+
+    def sweep(self) -> int:
+        # Keys expire on the server
+        return 0
+
+    def start_sweeper(self, interval: float):
+        pass
+
+    def __contains__(self, session_id: str) -> bool:
+        return bool(self.client.exists(self.key(session_id)))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=self.prefix + "*"))
+
+
+def create_session_store() -> SessionStore:
+    """Build the session store selected by the SESSION_STORE env variable."""
+    backend = os.getenv("SESSION_STORE", "memory")
+    ttl = float(os.getenv("SESSION_TTL", "3600"))
+
+    if backend == "memory":
+        store = InMemorySessionStore(max_sessions=int(os.getenv("SESSION_MAX", "1000")), ttl=ttl)
+    elif backend == "sqlite":
+        store = SQLiteSessionStore(path=os.getenv("SESSION_SQLITE_PATH", "sessions.db"), ttl=ttl)
+    elif backend == "redis":
+        store = RedisSessionStore.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl=ttl)
+    else:
+        raise ValueError(f"Unknown SESSION_STORE: {backend}")
+
+    return store
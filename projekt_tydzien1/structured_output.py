@@ -0,0 +1,108 @@
+"""How the model returns a structured answer, shared by the backend and the CLI.
+
+Two strategies:
+
+- `tool`: the schema is bound as a forced tool, the answer is the tool call arguments
+- `json`: provider-native structured output (`response_format` with a JSON
+  schema), the answer is JSON in the message text
+
+`auto` picks `json` when the model profile reports native structured output.
+Either way, only a compact text record of each asked question is kept in the
+history, without tool calls or placeholder tool results.
+"""
+import json
+from typing import List, Optional, Type
+
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.runnables import Runnable
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, ValidationError
+
+STRATEGIES = ("auto", "tool", "json")
+ASKED_PREFIX = "Pytanie: "
+ANSWER_SEPARATOR = " | Odpowiedź: "
+
+
+def supports_native_output(llm) -> bool:
+    profile = getattr(llm, "profile", None) or {}
+    return bool(profile.get("structured_output"))
+
+
+def resolve_strategy(llm, strategy: str = "auto") -> str:
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown output strategy {strategy!r}, expected one of {', '.join(STRATEGIES)}")
+    if strategy == "auto":
+        return "json" if supports_native_output(llm) else "tool"
+    return strategy
+
+
+def bind_structured(llm, schema: Type[BaseModel], strategy: str = "auto") -> Runnable:
+    """Model runnable returning an AIMessage that carries `schema` as a tool call or JSON text."""
+    if resolve_strategy(llm, strategy) == "json":
+        return llm.bind(response_format={
+            "type": "json_schema",
+            "json_schema": {"name": schema.__name__, "schema": schema.model_json_schema()}
+        })
+    return llm.bind_tools([schema], tool_choice=schema.__name__)
+
+
+def message_text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(block.get("text", "") for block in message.content
+                   if isinstance(block, dict) and block.get("type") == "text")
+
+
+def output_args(message: BaseMessage) -> Optional[dict]:
+    """Raw structured answer: the first tool call arguments or the JSON text."""
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        return tool_calls[0]["args"]
+    try:
+        data = json.loads(message_text(message))
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_structured(message: BaseMessage, schema: Type[BaseModel]) -> Optional[BaseModel]:
+    args = output_args(message)
+    if args is None:
+        return None
+    try:
+        return schema.model_validate(args)
+    except ValidationError:
+        return None
+
+
+def partial_output(chunk: BaseMessage) -> Optional[dict]:
+    """Fields parsed so far from an accumulated streamed chunk."""
+    tool_call_chunks = getattr(chunk, "tool_call_chunks", None)
+    raw = (tool_call_chunks[0].get("args") or "") if tool_call_chunks else message_text(chunk)
+    try:
+        partial = parse_partial_json(raw) if raw else None
+    except ValueError:
+        # Plain text, left to the repair stage once the message is complete
+        return None
+    return partial if isinstance(partial, dict) else None
+
+
+def compact_record(questions: List[BaseModel]) -> AIMessage:
+    """History entry for asked questions: one line per question with its correct answer."""
+    lines = [f"{ASKED_PREFIX}{q.question}{ANSWER_SEPARATOR}{getattr(q, q.correct_answer)}" for q in questions]
+    return AIMessage(content="\n".join(lines))
+
+
+def asked_in_message(message: BaseMessage) -> List[str]:
+    """Question texts recorded in a history message (compact records or older tool calls)."""
+    if not isinstance(message, AIMessage):
+        return []
+    asked = []
+    for tool_call in message.tool_calls or []:
+        args = tool_call.get("args") or {}
+        items = args.get("questions", [args]) if isinstance(args, dict) else []
+        asked.extend(item["question"] for item in items if isinstance(item, dict) and item.get("question"))
+    for line in message_text(message).splitlines():
+        if line.startswith(ASKED_PREFIX):
+            asked.append(line[len(ASKED_PREFIX):].split(ANSWER_SEPARATOR, 1)[0])
+    return asked
@@ -0,0 +1,201 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+
+from model_pool import CircuitBreaker, HedgedChatModel, ModelEntry
+
+
+class StubModel(Runnable):
+    """Answers after `delay` seconds, or raises `error`."""
+
+    def __init__(self, text: str, delay: float = 0.0, error: Exception = None):
+        self.text = text
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = 0
+
+    def invoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return AIMessage(content=self.text)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise self.error
+        return AIMessage(content=self.text)
+
+    async def astream(self, input, config=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        for part in self.text:
+            yield AIMessageChunk(content=part)
+
+
+def entry(name: str, model: StubModel, failures: int = 2, reset_timeout: float = 30):
+    return ModelEntry(name, model, CircuitBreaker(failures, reset_timeout)), model
+
+
+def hedged(*items, validate=lambda message: message.content != "bad", delay: float = 0.05):
+    return HedgedChatModel(list(items), validate, min_delay=delay, max_delay=delay, initial_delay=delay)
+
+
+def open_circuit(model_entry: ModelEntry, elapsed: float = 0.0):
+    for _ in range(model_entry.breaker.max_failures):
+        model_entry.fail()
+    model_entry.breaker.opened_at -= elapsed
+
+
+# Circuit breaker
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, reset_timeout=30)
+    assert not breaker.record_failure()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.is_open
+    assert not breaker.allow()
+
+
+def test_breaker_success_resets_failure_count():
+    breaker = CircuitBreaker(failures=2)
+    breaker.record_failure()
+    breaker.record_success()
+    assert not breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_breaker_lets_one_trial_through_after_timeout():
+    breaker = CircuitBreaker(failures=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_breaker_trial_success_closes():
+    breaker = CircuitBreaker(failures=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_trial_failure_reopens_for_another_timeout():
+    breaker = CircuitBreaker(failures=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+    assert breaker.allow()
+    assert breaker.record_failure()
+    assert not breaker.allow()
+    breaker.opened_at -= 31
+    assert breaker.allow()
+
+
+def test_breaker_released_trial_can_be_retried():
+    breaker = CircuitBreaker(failures=1, reset_timeout=30)
+    breaker.record_failure()
+    breaker.opened_at -= 31
+    assert breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+
+# Hedging
+
+def test_fast_primary_wins_without_hedge():
+    primary, fallback = entry("primary", StubModel("p")), entry("fallback", StubModel("f"))
+    result = asyncio.run(hedged(primary, fallback).ainvoke("q"))
+    assert result.content == "p"
+    assert fallback[1].calls == 0
+
+
+def test_fast_primary_does_not_use_up_fallback_trial():
+    primary, fallback = entry("primary", StubModel("p")), entry("fallback", StubModel("f"))
+    open_circuit(fallback[0], elapsed=31)
+    asyncio.run(hedged(primary, fallback).ainvoke("q"))
+    assert fallback[1].calls == 0
+    assert fallback[0].breaker.allow()
+
+
+def test_slow_primary_is_hedged_and_cancelled():
+    primary = entry("primary", StubModel("p", delay=1.0))
+    fallback = entry("fallback", StubModel("f"))
+    result = asyncio.run(hedged(primary, fallback).ainvoke("q"))
+    assert result.content == "f"
+    assert primary[1].cancelled == 1
+    # Losing a hedge is not a failure
+    assert primary[0].breaker.failures == 0
+    assert fallback[0].latencies
+
+
+def test_cancelled_trial_is_given_back():
+    primary = entry("primary", StubModel("p", delay=1.0))
+    fallback = entry("fallback", StubModel("f"))
+    open_circuit(primary[0], elapsed=31)
+    model = hedged(fallback, primary, delay=0.01)
+    fallback[1].delay = 0.05
+    result = asyncio.run(model.ainvoke("q"))
+    assert result.content == "f"
+    assert primary[1].cancelled == 1
+    assert primary[0].breaker.is_open
+    assert primary[0].breaker.allow()
+
+
+def test_failed_primary_falls_back_immediately():
+    primary = entry("primary", StubModel("p", error=RuntimeError("down")))
+    fallback = entry("fallback", StubModel("f"))
+    result = asyncio.run(hedged(primary, fallback, delay=10).ainvoke("q"))
+    assert result.content == "f"
+    assert primary[0].breaker.failures == 1
+
+
+def test_invalid_response_moves_to_next_model():
+    primary, fallback = entry("primary", StubModel("bad")), entry("fallback", StubModel("f"))
+    assert asyncio.run(hedged(primary, fallback, delay=10).ainvoke("q")).content == "f"
+
+
+def test_open_circuit_is_skipped():
+    primary, fallback = entry("primary", StubModel("p")), entry("fallback", StubModel("f"))
+    open_circuit(primary[0])
+    assert asyncio.run(hedged(primary, fallback).ainvoke("q")).content == "f"
+    assert primary[1].calls == 0
+
+
+def test_primary_is_tried_when_every_circuit_is_open():
+    primary, fallback = entry("primary", StubModel("p")), entry("fallback", StubModel("f"))
+    open_circuit(primary[0])
+    open_circuit(fallback[0])
+    assert asyncio.run(hedged(primary, fallback).ainvoke("q")).content == "p"
+
+
+def test_all_models_failing_raises_last_error():
+    primary = entry("primary", StubModel("p", error=RuntimeError("one")))
+    fallback = entry("fallback", StubModel("f", error=RuntimeError("two")))
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedged(primary, fallback).ainvoke("q"))
+
+
+def test_stream_hedges_on_first_chunk():
+    primary = entry("primary", StubModel("pp", delay=1.0))
+    fallback = entry("fallback", StubModel("ff"))
+
+    async def collect():
+        return "".join([chunk.content async for chunk in hedged(primary, fallback).astream("q")])
+
+    assert asyncio.run(collect()) == "ff"
+    assert fallback[0].latencies
+    assert primary[0].breaker.failures == 0
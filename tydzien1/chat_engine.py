@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+from typing import List, Optional
+
+from langchain.chat_models import init_chat_model
+from langchain_core.messages import (AIMessage, BaseMessage, HumanMessage, SystemMessage, messages_from_dict,
+                                     messages_to_dict, trim_messages)
+from langchain_core.messages.utils import count_tokens_approximately
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL = "claude-haiku-4-5"
+PROVIDER = "anthropic"
+SYSTEM_PROMPT = "Jesteś wesołym i pomocnym asystentem"
+SESSIONS_DIR = "sessions"
+EXIT_COMMANDS = ["exit", "quit", "q"]
+
+
+class ChatSession:
+    """Chat history kept within a token budget, optionally saved to a JSON file.
+
+    Turns that no longer fit in `max_tokens` are dropped, or with `summarize`
+    folded into a running summary appended to the system prompt.
+    """
+
+    def __init__(self, model, system: str = SYSTEM_PROMPT, max_tokens: int = 2000, summarize: bool = False,
+                 path: Optional[str] = None):
+        self.model = model
+        self.system = system
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.path = path
+        self.summary = ""
+        self.history: List[BaseMessage] = []
+        if path and os.path.exists(path):
+            self.load()
+
+    def system_message(self) -> SystemMessage:
+        if self.summary:
+            return SystemMessage(content=f"{self.system}\n\nPodsumowanie wcześniejszej rozmowy: {self.summary}")
+        return SystemMessage(content=self.system)
+
+    def context(self) -> List[BaseMessage]:
+        """Messages sent to the model: system prompt and the most recent turns that fit the budget."""
+        messages = [self.system_message()] + self.history
+        trimmed = trim_messages(messages, max_tokens=self.max_tokens, token_counter=count_tokens_approximately,
+                                strategy="last", include_system=True, start_on="human")
+        if len(trimmed) == 1 and self.history:
+            # The last message alone is over the budget, send it anyway
+            trimmed.append(self.history[-1])
+        return trimmed
+
+    def compact(self):
+        """Drop (or summarize) turns that fell out of the budget so the stored history stays bounded."""
+        kept = self.context()[1:]
+        dropped = self.history[:len(self.history) - len(kept)]
+        if not dropped:
+            return
+        if self.summarize:
+            transcript = "\n".join(f"{type(m).__name__}: {m.text}" for m in dropped)
+            prompt = (f"Dotychczasowe podsumowanie: {self.summary or '(brak)'}\n\nNowe wiadomości:\n{transcript}\n\n"
+                      f"Zaktualizuj podsumowanie rozmowy w kilku zdaniach, zachowując ważne fakty.")
+            self.summary = self.model.invoke([HumanMessage(content=prompt)]).text
+        self.history = kept
+
+    def stream(self, user_input: str):
+        """Yield the reply text as it arrives and add the turn to the history."""
+        self.history.append(HumanMessage(content=user_input))
+        reply = ""
+        try:
+            for chunk in self.model.stream(self.context()):
+                reply += chunk.text
+                yield chunk.text
+        except BaseException:
+            # Keep the history consistent when the reply is interrupted
+            self.history.pop()
+            raise
+        self.history.append(AIMessage(content=reply))
+        self.compact()
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"system": self.system, "summary": self.summary, "messages": messages_to_dict(self.history)},
+                      f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        self.system = data.get("system", self.system)
+        self.summary = data.get("summary", "")
+        self.history = messages_from_dict(data.get("messages", []))
+
+
+def repl(session: ChatSession):
+    if session.history:
+        print(f"Wznowiono rozmowę ({len(session.history)} wiadomości).")
+    while True:
+        user_input = input("You: ")
+        if user_input.lower() in EXIT_COMMANDS:
+            break
+        print("Assistant: ", end="", flush=True)
+        try:
+            for text in session.stream(user_input):
+                print(text, end="", flush=True)
+        except KeyboardInterrupt:
+            print("\n(przerwano odpowiedź)")
+            continue
+        print()
+
+
+def main(session_id: Optional[str] = None):
+    parser = argparse.ArgumentParser(description="Chatbot w terminalu")
+    parser.add_argument("--session", default=session_id, help="zapisuje rozmowę i wznawia ją przy kolejnym uruchomieniu")
+    parser.add_argument("--max-tokens", type=int, default=2000, help="budżet tokenów historii wysyłanej do modelu")
+    parser.add_argument("--summarize", action="store_true", help="streszczaj starsze wiadomości zamiast je usuwać")
+    args = parser.parse_args()
+
+    model = init_chat_model(MODEL, model_provider=PROVIDER)
+    path = os.path.join(SESSIONS_DIR, f"{args.session}.json") if args.session else None
+    repl(ChatSession(model, max_tokens=args.max_tokens, summarize=args.summarize, path=path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# The question schema, duplicate detection and the structured output handling are shared with the
+# backend in projekt_tydzien1
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "projekt_tydzien1"))
+
+from question_bank import QuestionBank, normalize_question
+from schemas import QuizQuestion
+
+# LangChain is imported lazily inside functions: it is the slowest part of the
+# app start-up and is not needed until the first question is generated.
+
+MODEL = "claude-haiku-4-5"
+PROVIDER = "anthropic"
+
+DIFFICULTY_PROMPTS = {
+    "Łatwy": "Pytania powinny być proste, oparte na powszechnie znanych faktach.",
+    "Średni": "Pytania powinny być na umiarkowanym poziomie trudności, wymagające pewnej wiedzy.",
+    "Trudny": "Pytania powinny być bardzo trudne, niszowe, wymagające eksperckiej wiedzy lub dużej precyzji."
+}
+
+
+# Process-wide pool of structured-output runnables, shared by all sessions
+_pool: Dict[Tuple[str, str, float, str], object] = {}
+_pool_lock = threading.Lock()
+
+
+def get_structured_llm(model: str = MODEL, provider: str = PROVIDER, temperature: float = 0.8,
+                       strategy: Optional[str] = None):
+    """Return a cached model runnable bound to the QuizQuestion schema (see structured_output.py).
+
+    The strategy (auto, tool or json) defaults to LLM_OUTPUT_STRATEGY, read on
+    each call so that a .env file loaded by the app after import applies.
+    """
+    strategy = strategy or os.getenv("LLM_OUTPUT_STRATEGY", "auto")
+    key = (model, provider, temperature, strategy)
+    runnable = _pool.get(key)
+    if runnable is None:
+        with _pool_lock:
+            runnable = _pool.get(key)
+            if runnable is None:
+                from langchain.chat_models import init_chat_model
+                from structured_output import bind_structured
+                llm = init_chat_model(model, model_provider=provider, temperature=temperature)
+                runnable = bind_structured(llm, QuizQuestion, strategy)
+                _pool[key] = runnable
+    return runnable
+
+
+def system_prompt(topic: str, difficulty: str) -> str:
+    return (
+        f"Jesteś kreatywnym twórcą quizów. Twoim zadaniem jest generowanie pytań na temat: {topic}. "
+        f"Poziom trudności: {difficulty}. {DIFFICULTY_PROMPTS.get(difficulty, '')} "
+        f"Każde pytanie musi być unikalne. Staraj się poruszać bardzo zróżnicowane aspekty tematu: "
+        f"zarówno fakty ogólne, niszowe ciekawostki, jak i konkretne dane techniczne lub historyczne. "
+        f"Unikaj pytań zbyt oczywistych i upewnij się, że tylko jedna odpowiedź jest poprawna."
+    )
+
+
+def question_summary(q: QuizQuestion) -> str:
+    """Text of an asked question kept in the history to avoid duplicates, same format as in the backend."""
+    from structured_output import compact_record
+
+    return compact_record([q]).content
+
+
+def build_messages(system: str, history: List[str]) -> list:
+    from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+    messages = [SystemMessage(content=system)]
+    for summary in history:
+        messages += [HumanMessage(content="Generuj kolejne pytanie."), AIMessage(content=summary)]
+    messages.append(HumanMessage(content="Generuj kolejne pytanie."))
+    return messages
+
+
+def parse_question(message) -> QuizQuestion:
+    from repair import repair_question
+    from structured_output import parse_structured
+
+    question = parse_structured(message, QuizQuestion) or repair_question(message)
+    if question is None:
+        raise ValueError("Model failed to generate structured output")
+    return question
+
+
+def generate_question(system: str, history: List[str], model: str = MODEL, provider: str = PROVIDER,
+                      temperature: float = 0.8) -> QuizQuestion:
+    """Generate the next question given the system prompt and summaries of previous questions."""
+    return parse_question(get_structured_llm(model, provider, temperature).invoke(build_messages(system, history)))
+
+
+async def agenerate_question(system: str, history: List[str], model: str = MODEL, provider: str = PROVIDER,
+                             temperature: float = 0.8) -> QuizQuestion:
+    """Async version of `generate_question`, for generating many questions concurrently."""
+    message = await get_structured_llm(model, provider, temperature).ainvoke(build_messages(system, history))
+    return parse_question(message)
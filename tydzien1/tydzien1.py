@@ -1,26 +1,19 @@
-from typing import Literal
-from pydantic import BaseModel, Field
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain.chat_models import init_chat_model
+from typing import Dict, List, Tuple
+from pydantic import ValidationError
 from dotenv import load_dotenv
+import argparse
+import asyncio
+import csv
+import itertools
+import json
 import os
 
-load_dotenv()
+from quiz_engine import (MODEL, PROVIDER, QuestionBank, QuizQuestion, agenerate_question, generate_question,
+                         normalize_question, question_summary, system_prompt)
 
-# Define the structured output model
-class QuizQuestion(BaseModel):
-    question: str = Field(description="Treść pytania")
-    a: str = Field(description="Opcja A")
-    b: str = Field(description="Opcja B")
-    c: str = Field(description="Opcja C")
-    d: str = Field(description="Opcja D")
-    correct_answer: Literal["a", "b", "c", "d"] = Field(description="Litera poprawnej odpowiedzi (a, b, c lub d)")
+load_dotenv()
 
 def main():
-    # Initialize the model
-    llm = init_chat_model("claude-haiku-4-5", model_provider="anthropic")
-    structured_llm = llm.with_structured_output(QuizQuestion)
-
     print("--- Generator Quizu AI ---")
     
     # Get user input
@@ -38,11 +31,10 @@ def main():
 
     topic = input("Podaj tematykę quizu: ")
 
-    messages = [
-        SystemMessage(content=f"Jesteś twórcą quizów. Generujesz pytania na temat: {topic}. "
-                              f"Każde pytanie musi być unikalne i nie powtarzać się z poprzednimi."
-                              f"Upewnij się, że tylko jedna odpowiedź na pytanie jest poprawna")
-    ]
+    system = (f"Jesteś twórcą quizów. Generujesz pytania na temat: {topic}. "
+              f"Każde pytanie musi być unikalne i nie powtarzać się z poprzednimi."
+              f"Upewnij się, że tylko jedna odpowiedź na pytanie jest poprawna")
+    history = []
 
     questions_data = []
     user_answers = []
@@ -51,15 +43,15 @@ def main():
         print(f"\nGeneruję pytanie {i+1}...")
         
         # Invoke LLM to get a structured question
-        # We pass the history of messages which includes previous questions (as AIMessages)
-        response = structured_llm.invoke(messages + [HumanMessage(content="Generuj kolejne pytanie.")])
+        # We pass the history which includes previous questions (as AIMessages)
+        response = generate_question(system, history)
         
         # Save question data
         questions_data.append(response)
         
         # Add to history to avoid duplicates
         # We store it as a string representation of the question content so the model sees it
-        messages.append(AIMessage(content=f"Pytanie {i+1}: {response.question} (Opcje: {response.a}, {response.b}, {response.c}, {response.d}. Poprawna: {response.correct_answer})"))
+        history.append(question_summary(response))
 
         # Ask the user
         print(f"\nPytanie {i+1}: {response.question}")
@@ -99,5 +91,107 @@ def main():
             print(f"Twoja odpowiedź: {ans}")
             print(f"Poprawna odpowiedź: {q.correct_answer} ({getattr(q, q.correct_answer)})")
 
+# Batch mode: generate question banks without interaction
+MAX_ATTEMPTS = 5
+HISTORY_LIMIT = 30
+# Jaccard similarity of words above which a question counts as a duplicate, as in the backend's question bank
+SIMILARITY_THRESHOLD = 0.8
+
+def read_jobs(path: str) -> List[Tuple[str, str, int]]:
+    """Rows of a CSV file with columns topic, difficulty, count."""
+    with open(path, newline="", encoding="utf-8") as f:
+        return [(row["topic"].strip(), row["difficulty"].strip(), int(row["count"]))
+                for row in csv.DictReader(f) if row.get("topic", "").strip()]
+
+def load_checkpoint(path: str) -> Tuple[Dict[Tuple[str, str], List[QuizQuestion]], Dict[Tuple[str, str], List[str]]]:
+    """Questions already written to the output file and their normalized texts, so an interrupted run can resume."""
+    done: Dict[Tuple[str, str], List[QuizQuestion]] = {}
+    seen: Dict[Tuple[str, str], List[str]] = {}
+    if not os.path.exists(path):
+        return done, seen
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                question = QuizQuestion.model_validate(record)
+            except (ValueError, ValidationError):
+                # A line cut off by an interruption
+                continue
+            done.setdefault((record["topic"], record["difficulty"]), []).append(question)
+            seen.setdefault((record["topic"], record["difficulty"]), []).append(normalize_question(question.question))
+    return done, seen
+
+def output_ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+async def run_batch(jobs: List[Tuple[str, str, int]], output: str, concurrency: int, temperature: float):
+    done, seen = load_checkpoint(output)
+    dedup = QuestionBank(similarity_threshold=SIMILARITY_THRESHOLD)
+    queue: asyncio.Queue = asyncio.Queue()
+    # Interleave the topics, so concurrent workers rarely generate from the same history snapshot
+    pending = [[(topic, difficulty)] * max(count - len(done.get((topic, difficulty), [])), 0)
+               for topic, difficulty, count in jobs]
+    for job in itertools.chain.from_iterable(itertools.zip_longest(*pending)):
+        if job:
+            queue.put_nowait(job)
+    print(f"Do wygenerowania: {queue.qsize()} pytań ({sum(map(len, done.values()))} już w {output})")
+
+    stats = {"written": 0, "duplicates": 0, "failed": 0}
+
+    async def worker(out):
+        while True:
+            try:
+                topic, difficulty = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            questions = done.setdefault((topic, difficulty), [])
+            asked = seen.setdefault((topic, difficulty), [])
+            for attempt in range(MAX_ATTEMPTS):
+                history = [question_summary(q) for q in questions[-HISTORY_LIMIT:]]
+                try:
+                    question = await agenerate_question(system_prompt(topic, difficulty), history,
+                                                        MODEL, PROVIDER, temperature)
+                except Exception as e:
+                    print(f"Błąd ({topic}, {difficulty}): {e}")
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                text = normalize_question(question.question)
+                if dedup.is_duplicate(text, asked):
+                    stats["duplicates"] += 1
+                    continue
+                asked.append(text)
+                questions.append(question)
+                out.write(json.dumps({"topic": topic, "difficulty": difficulty, **question.model_dump()},
+                                     ensure_ascii=False) + "\n")
+                out.flush()
+                stats["written"] += 1
+                break
+            else:
+                stats["failed"] += 1
+
+    with open(output, "a", encoding="utf-8") as out:
+        if out.tell() and not output_ends_with_newline(output):
+            # Start after a line cut off by an interruption
+            out.write("\n")
+        await asyncio.gather(*(worker(out) for _ in range(concurrency)))
+    print(f"Zapisano: {stats['written']}, odrzucone duplikaty: {stats['duplicates']}, nieudane: {stats['failed']}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generator quizu AI")
+    parser.add_argument("--batch", metavar="CSV", help="plik z kolumnami topic,difficulty,count; generuje pytania bez interakcji")
+    parser.add_argument("--output", default="pytania.jsonl", help="plik JSONL z pytaniami, wznawiany po przerwaniu")
+    parser.add_argument("--concurrency", type=int, default=8, help="liczba równoległych zapytań do modelu")
+    parser.add_argument("--temperature", type=float, default=0.8)
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.batch:
+        try:
+            asyncio.run(run_batch(read_jobs(args.batch), args.output, args.concurrency, args.temperature))
+        except KeyboardInterrupt:
+            print("\nPrzerwano. Uruchom ponownie z tym samym --output, aby wznowić.")
+    else:
+        main()
@@ -1,27 +1,12 @@
 import streamlit as st
-from typing import Literal
-from pydantic import BaseModel, Field
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage
-from langchain.chat_models import init_chat_model
 from dotenv import load_dotenv
-import os
+from quiz_engine import generate_question, question_summary, system_prompt
 
 # Load env from parent directory as requested
 load_dotenv()
 
-# Define the structured output model
-class QuizQuestion(BaseModel):
-    question: str = Field(description="Treść pytania")
-    a: str = Field(description="Opcja A")
-    b: str = Field(description="Opcja B")
-    c: str = Field(description="Opcja C")
-    d: str = Field(description="Opcja D")
-    correct_answer: Literal["a", "b", "c", "d"] = Field(description="Litera poprawnej odpowiedzi (a, b, c lub d)")
-
-def init_llm():
-    # Increase temperature to 0.8 for more variety/randomness
-    llm = init_chat_model("claude-haiku-4-5", model_provider="anthropic", temperature=0.8)
-    return llm.with_structured_output(QuizQuestion)
+# Increase temperature to 0.8 for more variety/randomness
+TEMPERATURE = 0.8
 
 def main():
     st.set_page_config(page_title="Generator Quizu AI", page_icon="❓")
@@ -32,7 +17,8 @@ def main():
         st.session_state.step = "setup"
         st.session_state.questions = []
         st.session_state.user_answers = []
-        st.session_state.messages = []
+        st.session_state.system_prompt = ""
+        st.session_state.history = []
         st.session_state.num_questions = 3
         st.session_state.topic = ""
         st.session_state.difficulty = "Średni"
@@ -52,19 +38,8 @@ def main():
                 st.error("Proszę podać tematykę!")
             else:
                 st.session_state.step = "quiz"
-                difficulty_prompt = {
-                    "Łatwy": "Pytania powinny być proste, oparte na powszechnie znanych faktach.",
-                    "Średni": "Pytania powinny być na umiarkowanym poziomie trudności, wymagające pewnej wiedzy.",
-                    "Trudny": "Pytania powinny być bardzo trudne, niszowe, wymagające eksperckiej wiedzy lub dużej precyzji."
-                }
-                
-                st.session_state.messages = [
-                    SystemMessage(content=f"Jesteś kreatywnym twórcą quizów. Twoim zadaniem jest generowanie pytań na temat: {st.session_state.topic}. "
-                                          f"Poziom trudności: {st.session_state.difficulty}. {difficulty_prompt[st.session_state.difficulty]} "
-                                          f"Każde pytanie musi być unikalne. Staraj się poruszać bardzo zróżnicowane aspekty tematu: "
-                                          f"zarówno fakty ogólne, niszowe ciekawostki, jak i konkretne dane techniczne lub historyczne. "
-                                          f"Unikaj pytań zbyt oczywistych i upewnij się, że tylko jedna odpowiedź jest poprawna.")
-                ]
+                st.session_state.system_prompt = system_prompt(st.session_state.topic, st.session_state.difficulty)
+                st.session_state.history = []
                 st.rerun()
 
     # Quiz Phase
@@ -80,11 +55,11 @@ def main():
         if len(st.session_state.questions) <= current_idx:
             with st.spinner(f"Generuję pytanie {current_idx + 1}..."):
                 try:
-                    structured_llm = init_llm()
-                    response = structured_llm.invoke(st.session_state.messages + [HumanMessage(content="Generuj kolejne pytanie.")])
+                    # The model client is cached per process and shared by all browser sessions
+                    response = generate_question(st.session_state.system_prompt, st.session_state.history, temperature=TEMPERATURE)
                     st.session_state.questions.append(response)
                     # Add to history to avoid duplicates (same logic as CLI)
-                    st.session_state.messages.append(AIMessage(content=f"Pytanie {current_idx + 1}: {response.question} (Opcje: {response.a}, {response.b}, {response.c}, {response.d}. Poprawna: {response.correct_answer})"))
+                    st.session_state.history.append(question_summary(response))
                 except Exception as e:
                     st.error(f"Błąd podczas generowania pytania: {e}")
                     return